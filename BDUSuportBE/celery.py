@@ -10,13 +10,28 @@ app.autodiscover_tasks()
 app.conf.task_default_queue = "bdu_support"
 app.conf.broker_connection_retry_on_startup = True
 app.conf.beat_schedule = {
+    "prewarm_bdu_dw_cache": {
+        "task": "bduSuport.tasks.cron_tasks.prewarm_bdu_dw_cache",
+        # before the first schedule_student_attendance_notifications run, which reads the time tables it warms
+        "schedule": crontab(minute=30, hour=5)
+    },
+    "schedule_student_attendance_notifications": {
+        "task": "bduSuport.tasks.cron_tasks.schedule_student_attendance_notifications",
+        # every ATTENDANCE_SCHEDULE_WINDOW minutes, attendances are checked right after each student's last lesson
+        "schedule": crontab(minute="*/30", hour="6-21")
+    },
     "send_student_attendance_notification": {
         "task": "bduSuport.tasks.cron_tasks.send_student_attendance_notification",
-        "schedule": crontab(minute=40, hour=21)
+        # nightly sweep of every student after the last lesson, only new or changed attendances are notified
+        "schedule": crontab(minute=0, hour=22)
     },
     "send_student_academic_classification_notification": {
         "task": "bduSuport.tasks.cron_tasks.send_student_academic_classification_notification",
         "schedule": crontab(minute=0, hour=23)
+    },
+    "sync_bdu_students": {
+        "task": "bduSuport.tasks.cron_tasks.sync_bdu_students",
+        "schedule": crontab(minute=15)
     }
 }
 
@@ -0,0 +1,21 @@
+from datetime import time
+
+# end of every lesson period (tiết) of the school's bell schedule, 50 minute periods:
+# morning 1-5 from 07:00, afternoon 6-10 from 13:00, evening 11-15 from 17:30
+lesson_period_end_times = {
+    1: time(7, 50),
+    2: time(8, 40),
+    3: time(9, 40),
+    4: time(10, 30),
+    5: time(11, 20),
+    6: time(13, 50),
+    7: time(14, 40),
+    8: time(15, 40),
+    9: time(16, 30),
+    10: time(17, 20),
+    11: time(18, 20),
+    12: time(19, 10),
+    13: time(20, 0),
+    14: time(20, 50),
+    15: time(21, 40),
+}
@@ -0,0 +1,2 @@
+class BduDwUnavailableException(Exception):
+    pass
@@ -0,0 +1,11 @@
+import datetime
+from celery import current_app
+
+def local_now() -> datetime.datetime:
+    """
+    Now in the school's timezone (CELERY_TIMEZONE), the servers themselves run in UTC.
+    """
+    return datetime.datetime.now(current_app.timezone)
+
+def local_today() -> datetime.date:
+    return local_now().date()
@@ -0,0 +1,42 @@
+from django.db import models
+
+class BduStudent(models.Model):
+    """
+    Local mirror of the data warehouse student profiles (fact_ho_so_sinh_vien_odp),
+    kept up to date incrementally by the sync_bdu_students cron task.
+    """
+    class Meta:
+        db_table = "bdu_student"
+
+    id = models.AutoField(primary_key=True)
+    student_id = models.IntegerField(unique=True)
+    id_card = models.CharField(max_length=30, db_index=True)
+    date_of_birth = models.DateField(null=True)
+    full_name = models.CharField(max_length=255)
+    first_name = models.CharField(max_length=100)
+    last_name = models.CharField(max_length=255)
+    email = models.CharField(max_length=255)
+    gender = models.CharField(max_length=20)
+    ethnicity = models.CharField(max_length=100, null=True)
+    religion = models.CharField(max_length=100)
+    attendance = models.CharField(max_length=100, null=True)
+    residence = models.CharField(max_length=255)
+    place_of_birth = models.CharField(max_length=255)
+    phone_number = models.CharField(max_length=20)
+    source = models.CharField(max_length=100)
+    academic_year = models.CharField(max_length=20)
+    degree_name = models.CharField(max_length=100)
+    education_system_code = models.CharField(max_length=50, null=True)
+    faculty_code = models.CharField(max_length=50)
+    faculty_name = models.CharField(max_length=255)
+    field_code = models.CharField(max_length=50)
+    field_name = models.CharField(max_length=255)
+    major_code = models.CharField(max_length=50, null=True)
+    major_name = models.CharField(max_length=255, null=True)
+    class_code = models.CharField(max_length=50)
+    class_name = models.CharField(max_length=255, null=True)
+    advisor_code = models.CharField(max_length=50, null=True)
+    advisor_name = models.CharField(max_length=255, null=True)
+    dw_created_at = models.DateTimeField(null=True)
+    dw_updated_at = models.DateTimeField(null=True, db_index=True)
+    synced_at = models.DateTimeField(auto_now=True)
@@ -12,4 +12,6 @@ class MiniappNotification(models.Model):
     read_at = models.DateTimeField(null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    deleted_at = models.DateTimeField(null=True)
\ No newline at end of file
+    deleted_at = models.DateTimeField(null=True)
+    # "<source type>:<source id>[:<version>]:<user id>", a notification with a key is stored at most once
+    idempotency_key = models.CharField(max_length=255, null=True, unique=True)
\ No newline at end of file
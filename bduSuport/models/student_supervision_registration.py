@@ -4,6 +4,9 @@ from bduSuport.models.mini_app_user import MiniAppUser
 class StudentSupervisionRegistration(models.Model):
     class Meta:
         db_table = "student_supervision_registration"
+        indexes = [
+            models.Index(fields=["miniapp_user", "student_dw_code", "deleted_at"], name="ssr_user_student_deleted_idx"),
+        ]
 
     id = models.AutoField(primary_key=True)
     miniapp_user = models.ForeignKey(MiniAppUser, on_delete=models.CASCADE, related_name="student_supervision_registrations")
@@ -0,0 +1,27 @@
+from django.db import models
+
+class TaskRun(models.Model):
+    class Meta:
+        db_table = "task_run"
+        indexes = [
+            models.Index(fields=["task", "started_at"], name="task_run_task_started_idx"),
+        ]
+
+    id = models.AutoField(primary_key=True)
+    task = models.CharField(max_length=255)
+    run_id = models.CharField(max_length=255, unique=True)
+    failed = models.BooleanField(default=False)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    # seconds
+    duration = models.FloatField()
+    num_students = models.IntegerField(default=0)
+    num_notifications = models.IntegerField(default=0)
+    num_errors = models.IntegerField(default=0)
+    num_gateway_calls = models.IntegerField(default=0)
+    num_gateway_errors = models.IntegerField(default=0)
+    # milliseconds, null when the run made no gateway call
+    gateway_latency_p50 = models.FloatField(null=True)
+    gateway_latency_p95 = models.FloatField(null=True)
+    gateway_latency_p99 = models.FloatField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
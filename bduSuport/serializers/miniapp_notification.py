@@ -4,7 +4,7 @@ from ..models.miniapp_notification import MiniappNotification
 class MiniappNotificationSerializer(serializers.ModelSerializer):
     class Meta: 
         model = MiniappNotification
-        fields = "__all__"
+        exclude = ["idempotency_key"]
 
     is_read = serializers.SerializerMethodField()
 
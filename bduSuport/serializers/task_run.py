@@ -0,0 +1,8 @@
+from rest_framework import serializers
+
+from bduSuport.models.task_run import TaskRun
+
+class TaskRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TaskRun
+        fields = "__all__"
@@ -0,0 +1,125 @@
+import json
+import logging
+from datetime import date, time
+from typing import Dict, Iterable, List, Optional
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from bduSuport.const.lesson_periods import lesson_period_end_times
+from bduSuport.services.bdu_dw.dto import TimeTable
+
+# an empty Redis hash does not exist, this field marks a schedule that was built for a day without lessons
+BUILT_MARKER = "_"
+SCHEDULE_TTL = 2 * 24 * 3600
+# a dispatcher run building the schedule holds this lock, should a build outlive it save still keeps the first schedule
+BUILD_LOCK_TTL = 30 * 60
+
+# Writes the schedule unless one was already built for the day, whose slots may have been handed out since.
+SAVE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[2]) == 1 then
+    return 0
+end
+
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[1]))
+
+return 1
+"""
+
+def get_last_lesson_end_time(time_tables: Iterable[TimeTable]) -> Optional[time]:
+    """
+    End of the latest lesson of the day, None when there is no lesson or no period maps to a time.
+    """
+    end_times = []
+
+    for time_table in time_tables:
+        try:
+            last_period = int(time_table.start_period) + max(int(time_table.periods), 1) - 1
+        except (TypeError, ValueError):
+            logging.getLogger().error("get_last_lesson_end_time invalid periods start_period=%s, periods=%s", time_table.start_period, time_table.periods)
+            continue
+
+        if last_period in lesson_period_end_times:
+            end_times.append(lesson_period_end_times[last_period])
+
+    return max(end_times) if end_times else None
+
+def group_students_by_last_lesson(time_tables: Dict[int, List[TimeTable]]) -> Dict[time, List[int]]:
+    """
+    Student codes by the end time of their last lesson, students without a lesson are left out.
+    """
+    groups = {}
+
+    for student_code, student_time_tables in time_tables.items():
+        end_time = get_last_lesson_end_time(student_time_tables)
+
+        if end_time is not None:
+            groups.setdefault(end_time, []).append(student_code)
+
+    return groups
+
+class AttendanceScheduleService():
+    """
+    Keeps a day's attendance check slots in the Redis hash attendance_schedule:<date>, "HH:MM" (end of the last
+    lesson) -> student codes. The schedule is built once in the morning and its slots are handed out as they come due.
+    """
+    def is_built(self, schedule_date: date) -> bool:
+        try:
+            return bool(get_redis_connection("default").hexists(self.__make_key(schedule_date), BUILT_MARKER))
+        except Exception as e:
+            logging.getLogger().exception("AttendanceScheduleService.is_built exc=%s, schedule_date=%s", str(e), schedule_date)
+            return False
+
+    def acquire_build(self, schedule_date: date) -> bool:
+        """
+        Lets a single dispatcher run build the day's schedule, the others go on with the slots already saved.
+        """
+        try:
+            return bool(cache.add(f"{self.__make_key(schedule_date)}:lock", 1, BUILD_LOCK_TTL))
+        except Exception as e:
+            logging.getLogger().exception("AttendanceScheduleService.acquire_build exc=%s, schedule_date=%s", str(e), schedule_date)
+            return True
+
+    def release_build(self, schedule_date: date):
+        try:
+            cache.delete(f"{self.__make_key(schedule_date)}:lock")
+        except Exception as e:
+            logging.getLogger().exception("AttendanceScheduleService.release_build exc=%s, schedule_date=%s", str(e), schedule_date)
+
+    def save(self, schedule_date: date, slots: Dict[time, List[int]]) -> bool:
+        """
+        Saves the schedule in one step, returns False and keeps the existing one when the day was already built.
+        """
+        args = [SCHEDULE_TTL, BUILT_MARKER, ""]
+
+        for end_time, student_codes in slots.items():
+            args.extend([end_time.strftime("%H:%M"), json.dumps(student_codes)])
+
+        script = get_redis_connection("default").register_script(SAVE_SCRIPT)
+
+        return bool(script(keys=[self.__make_key(schedule_date)], args=args))
+
+    def pop_due(self, schedule_date: date, until: time) -> Dict[time, List[int]]:
+        """
+        Removes and returns the slots ending at or before until. A slot is returned to one caller only,
+        so overlapping dispatcher runs never enqueue it twice.
+        """
+        key = self.__make_key(schedule_date)
+        redis = get_redis_connection("default")
+        due = {}
+
+        for field, value in redis.hgetall(key).items():
+            field = field.decode()
+
+            if field == BUILT_MARKER:
+                continue
+
+            end_time = time.fromisoformat(field)
+
+            if end_time <= until and redis.hdel(key, field):
+                due[end_time] = json.loads(value)
+
+        return due
+
+    def __make_key(self, schedule_date: date) -> str:
+        return f"attendance_schedule:{schedule_date.isoformat()}"
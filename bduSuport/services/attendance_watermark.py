@@ -0,0 +1,44 @@
+import logging
+from datetime import date
+from typing import List
+from django_redis import get_redis_connection
+
+from bduSuport.services.bdu_dw.dto import Attendance
+
+# a day's marks are only compared against runs of the same day, a little slack covers runs around midnight
+WATERMARK_TTL = 2 * 24 * 3600
+
+def get_attendance_version(attendance: Attendance) -> str:
+    updated_at = attendance.updated_at.isoformat() if attendance.updated_at else ""
+
+    return f"{updated_at}|{attendance.status}"
+
+class AttendanceWatermarkService():
+    """
+    Remembers, per student and day, the version (updated_at and status) of every attendance row already notified
+    in a Redis hash attendance_id -> version, so the notification cron only handles rows that are new or changed.
+    """
+    def get_changed(self, student_code: int, attendance_date: date, attendances: List[Attendance]) -> List[Attendance]:
+        try:
+            seen = get_redis_connection("default").hgetall(self.__make_key(student_code, attendance_date))
+        except Exception as e:
+            logging.getLogger().exception("AttendanceWatermarkService.get_changed exc=%s, student_code=%s, attendance_date=%s", str(e), student_code, attendance_date)
+            seen = {}
+
+        seen = {attendance_id.decode(): version.decode() for attendance_id, version in seen.items()}
+
+        return [attendance for attendance in attendances if seen.get(str(attendance.attendance_id)) != get_attendance_version(attendance)]
+
+    def commit(self, student_code: int, attendance_date: date, attendances: List[Attendance]):
+        if not attendances:
+            return
+
+        try:
+            key = self.__make_key(student_code, attendance_date)
+            versions = {str(attendance.attendance_id): get_attendance_version(attendance) for attendance in attendances}
+            get_redis_connection("default").pipeline().hset(key, mapping=versions).expire(key, WATERMARK_TTL).execute()
+        except Exception as e:
+            logging.getLogger().exception("AttendanceWatermarkService.commit exc=%s, student_code=%s, attendance_date=%s", str(e), student_code, attendance_date)
+
+    def __make_key(self, student_code: int, attendance_date: date) -> str:
+        return f"attendance_watermark:{student_code}:{attendance_date.isoformat()}"
@@ -0,0 +1,342 @@
+import time
+import asyncio
+import logging
+import httpx
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decouple import config
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from bduSuport.errors.bdu_dw_unavailable_exception import BduDwUnavailableException
+from bduSuport.services.bdu_dw.cache import BduDwCache
+from bduSuport.services.bdu_dw.circuit_breaker import BduDwCircuitBreaker
+from bduSuport.services.bdu_dw.rate_limiter import MAX_WAITS, PRIORITY_INTERACTIVE, BduDwRateLimiter
+from bduSuport.services.bdu_dw.single_flight import BduDwSingleFlight
+from bduSuport.services.bdu_dw.telemetry import record_gateway_call
+from bduSuport.services.bdu_dw.dto import Attendance, BduStudentDto, StudentScore, TimeTable, StudentEvent, StudentClassification
+from bduSuport.services.bdu_dw.queries import ATTENDANCE_CHUNK_DAYS, DwQuery, clean_params, convert_dataset, read_dataset, split_date_range, merge_attendance_chunks, attendances_query, student_query, student_scores_query, time_tables_query, student_events_query, academic_classifications_query
+from bduSuport.services.bdu_dw.session import MAX_RETRIES, POOL_MAXSIZE, RETRY_STATUSES, VERIFY_SSL, get_backoff_time, get_timeout
+
+T = TypeVar("T")
+
+DEFAULT_CONCURRENCY = config("BDU_DATA_WAREHOUSE_GATEWAY_CONCURRENCY", 10, cast=int)
+
+_thread_state = threading.local()
+
+def make_client(max_connections: Optional[int]) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        auth=(config("BDU_DATA_WAREHOUSE_GATEWAY_USERNAME"), config("BDU_DATA_WAREHOUSE_GATEWAY_PASSWORD")),
+        verify=VERIFY_SSL,
+        headers={"Accept": "application/json"},
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=POOL_MAXSIZE),
+    )
+
+class AsyncBduDwService:
+    """
+    Non-blocking twin of BduDwService returning the same DTOs, must be used as an async context manager:
+
+        async with AsyncBduDwService() as service:
+            attendances = await service.get_attendances_for_students(codes, today, today)
+
+    At most `concurrency` gateway requests are in flight at once whatever the number of awaited calls.
+    """
+    __base_url = ""
+    __cache = None
+    __circuit_breaker = None
+    __single_flight = None
+    __rate_limiter = None
+    __use_cache = True
+    __strict = False
+    __priority = PRIORITY_INTERACTIVE
+    served_stale = False
+    served_partial = False
+    __concurrency = DEFAULT_CONCURRENCY
+    __client = None
+    __owns_client = True
+    __semaphore = None
+
+    def __init__(self, use_cache: bool = True, concurrency: int = DEFAULT_CONCURRENCY, strict: bool = False, priority: str = PRIORITY_INTERACTIVE, client: Optional[httpx.AsyncClient] = None):
+        """
+        strict=True raises BduDwUnavailableException when a dataset could not be fetched (nor served stale)
+        instead of returning an empty list, so callers can tell a failure from a student without data.
+        Non strict, the empty list sets served_partial.
+
+        A client passed in (see run_with_async_service) is used as is and left open on exit.
+
+        Every request attempt takes a token from the shared rate limiter, see BduDwService for priority.
+        """
+        self.__base_url = config("BDU_DATA_WAREHOUSE_GATEWAY_BASE_URL")
+        self.__cache = BduDwCache()
+        self.__circuit_breaker = BduDwCircuitBreaker()
+        self.__single_flight = BduDwSingleFlight()
+        self.__rate_limiter = BduDwRateLimiter(priority)
+        self.__use_cache = use_cache
+        self.__strict = strict
+        self.__priority = priority
+        self.__concurrency = max(1, concurrency)
+        self.__client = client
+        self.__owns_client = client is None
+
+    async def __aenter__(self):
+        if self.__owns_client:
+            self.__client = make_client(max(self.__concurrency, POOL_MAXSIZE))
+
+        self.__semaphore = asyncio.Semaphore(self.__concurrency)
+
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.__owns_client:
+            await self.__client.aclose()
+            self.__client = None
+
+    async def __run(self, query: DwQuery) -> list:
+        dataset = await self.__fetch_dataset(query)
+
+        if dataset is None:
+            if self.__strict:
+                raise BduDwUnavailableException(query.method)
+
+            self.served_partial = True
+
+        return convert_dataset("AsyncBduDwService", query, dataset)
+
+    async def __fetch_dataset(self, query: DwQuery) -> Optional[list]:
+        if self.__use_cache and query.cache:
+            dataset = self.__cache.get(query.endpoint, query.params)
+
+            if dataset is not None:
+                return dataset
+
+        if not self.__circuit_breaker.allow_request():
+            logging.getLogger().warning("AsyncBduDwService.%s circuit open, skip gateway params=%s", query.method, query.params)
+            return self.__get_stale_dataset(query)
+
+        dataset = await self.__request_coalesced(query)
+
+        if dataset is None:
+            return self.__get_stale_dataset(query)
+
+        if query.cache:
+            self.__cache.set(query.endpoint, query.params, dataset)
+
+        return dataset
+
+    async def __request_coalesced(self, query: DwQuery) -> Optional[list]:
+        key = self.__cache.make_key(query.endpoint, query.params)
+        # the leader may wait for a rate limiter token before its request, the flight covers both
+        timeout = sum(get_timeout(query.endpoint, query.bulk)) + MAX_WAITS[self.__priority]
+
+        if self.__single_flight.acquire(key, timeout):
+            dataset = None
+
+            try:
+                dataset = await self.__request_dataset(query)
+            finally:
+                self.__single_flight.publish(key, dataset)
+
+            return dataset
+
+        done, dataset = await self.__single_flight.wait_async(key, timeout)
+
+        if done:
+            return dataset
+
+        return await self.__request_dataset(query)
+
+    def __get_stale_dataset(self, query: DwQuery) -> Optional[list]:
+        # callers asking for live data get a failure rather than an old copy
+        if not self.__use_cache or not query.cache:
+            return None
+
+        dataset = self.__cache.get_stale(query.endpoint, query.params)
+
+        if dataset is not None:
+            self.served_stale = True
+
+        return dataset
+
+    async def __request_dataset(self, query: DwQuery) -> Optional[list]:
+        connect_timeout, read_timeout = get_timeout(query.endpoint, query.bulk)
+        resp = None
+
+        for attempt in range(MAX_RETRIES + 1):
+            resp = None
+
+            try:
+                async with self.__semaphore:
+                    # taken once a slot is free, so MAX_WAITS bounds the wait for a token and not the queue of a large gather
+                    if not await self.__rate_limiter.acquire_async(query.endpoint):
+                        return None
+
+                    started_at = time.monotonic()
+
+                    try:
+                        resp = await self.__client.get(
+                            f"{self.__base_url}/{query.endpoint}",
+                            params=clean_params(query.params),
+                            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                        )
+                    finally:
+                        record_gateway_call(time.monotonic() - started_at, resp is None or resp.status_code >= 500)
+
+                if resp.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+                    await asyncio.sleep(get_backoff_time(attempt + 1))
+                    continue
+
+                if resp.status_code >= 500:
+                    self.__circuit_breaker.record_failure()
+                else:
+                    self.__circuit_breaker.record_success()
+
+                return read_dataset("AsyncBduDwService", query, resp)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if attempt < MAX_RETRIES:
+                    await asyncio.sleep(get_backoff_time(attempt + 1))
+                    continue
+
+                self.__circuit_breaker.record_failure()
+                logging.getLogger().exception("AsyncBduDwService.%s exc=%s, params=%s", query.method, str(e), query.params)
+                return None
+            except Exception as e:
+                if isinstance(e, httpx.TransportError):
+                    self.__circuit_breaker.record_failure()
+
+                logging.getLogger().exception("AsyncBduDwService.%s exc=%s, params=%s, resp_content=%s", query.method, str(e), query.params, resp.text if resp is not None else None)
+                return None
+
+        return None
+
+    async def gather(self, calls: Iterable[Awaitable[T]], return_exceptions: bool = False) -> List[T]:
+        return await asyncio.gather(*calls, return_exceptions=return_exceptions)
+
+    async def prewarm(self, queries: Iterable[DwQuery]) -> int:
+        """
+        Fetches every query from the gateway and writes it to the cache, returns how many were warmed.
+        """
+        async def warm(query: DwQuery) -> bool:
+            if not query.cache or not self.__circuit_breaker.allow_request():
+                return False
+
+            dataset = await self.__request_coalesced(query)
+
+            if dataset is None:
+                return False
+
+            self.__cache.set(query.endpoint, query.params, dataset)
+
+            return True
+
+        return sum(await self.gather(warm(query) for query in queries))
+
+    async def get_attendances_by_student_code_and_date_range(self, student_code: int, date_start: date, date_end: date) -> List[Attendance]:
+        return await self.__run(attendances_query(student_code, date_start, date_end))
+
+    async def get_attendances_by_date_range(self, student_code: int, date_start: date, date_end: date) -> List[Attendance]:
+        """
+        Fetches the range as aligned ATTENDANCE_CHUNK_DAYS chunks concurrently, so any range length costs
+        about one chunk of latency and past chunks are served from the cache with the closed TTL.
+        Returns the attendances between date_start and date_end sorted by date.
+        """
+        chunks = split_date_range(date_start, date_end, ATTENDANCE_CHUNK_DAYS)
+        results = await self.gather(self.get_attendances_by_student_code_and_date_range(student_code, chunk_start, chunk_end) for chunk_start, chunk_end in chunks)
+
+        return list(merge_attendance_chunks(results, date_start, date_end))
+
+    async def get_student(self, student_id: str) -> Optional[BduStudentDto]:
+        query = student_query(student_id)
+        dataset = await self.__fetch_dataset(query)
+
+        if not dataset:
+            logging.getLogger().error("AsyncBduDwService.get_student student not found student_id=%s", student_id)
+            return None
+
+        students = convert_dataset("AsyncBduDwService", query, dataset[:1])
+
+        return students[0] if students else None
+
+    async def get_student_scores(self, student_code: str, semester: int, academic_year: int) -> List[StudentScore]:
+        return await self.__run(student_scores_query(student_code, semester, academic_year))
+
+    async def get_time_tables(self, student_code: str, date: date) -> List[TimeTable]:
+        return await self.__run(time_tables_query(student_code, date))
+
+    async def get_student_events(self, student_code: str, nkhk: int) -> List[StudentEvent]:
+        return await self.__run(student_events_query(student_code, nkhk))
+
+    async def get_student_academic_classifications(self, student_code: str, date: date = None) -> List[StudentClassification]:
+        return await self.__run(academic_classifications_query(student_code, date))
+
+    async def get_attendances_for_students(self, student_codes: Iterable[int], date_start: date, date_end: date) -> Dict[int, List[Attendance]]:
+        student_codes = list(student_codes)
+        results = await self.gather(self.get_attendances_by_student_code_and_date_range(code, date_start, date_end) for code in student_codes)
+
+        return dict(zip(student_codes, results))
+
+    async def get_attendances_for_dates(self, student_code: int, dates: Iterable[date]) -> Dict[date, List[Attendance]]:
+        dates = list(dates)
+        results = await self.gather(self.get_attendances_by_student_code_and_date_range(student_code, _date, _date) for _date in dates)
+
+        return dict(zip(dates, results))
+
+    async def get_time_tables_for_dates(self, student_code: int, dates: Iterable[date]) -> Dict[date, List[TimeTable]]:
+        dates = list(dates)
+        results = await self.gather(self.get_time_tables(student_code, _date) for _date in dates)
+
+        return dict(zip(dates, results))
+
+    async def get_time_tables_for_students(self, student_codes: Iterable[int], date: date) -> Dict[int, List[TimeTable]]:
+        student_codes = list(student_codes)
+        results = await self.gather(self.get_time_tables(code, date) for code in student_codes)
+
+        return dict(zip(student_codes, results))
+
+def get_thread_loop() -> Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]:
+    """
+    An event loop and a gateway client kept for the life of the calling thread (a gunicorn or celery worker thread),
+    so successive run_with_async_service calls reuse its keep-alive connections instead of new TCP and TLS handshakes.
+    Concurrency is bounded by each service's semaphore, not by the client.
+    """
+    if getattr(_thread_state, "loop", None) is None:
+        _thread_state.loop = asyncio.new_event_loop()
+        _thread_state.client = make_client(None)
+
+    return _thread_state.loop, _thread_state.client
+
+def run_with_async_service(handler: Callable[[AsyncBduDwService], Awaitable[T]], **service_kwargs) -> T:
+    """
+    Runs handler(service) to completion from synchronous code (celery tasks, DRF views) on the thread's
+    long-lived loop and client (see get_thread_loop), e.g.
+
+        run_with_async_service(lambda service: service.get_attendances_for_students(codes, today, today), concurrency=20)
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        loop, client = get_thread_loop()
+
+        async def shared_runner():
+            async with AsyncBduDwService(client=client, **service_kwargs) as service:
+                return await handler(service)
+
+        try:
+            return loop.run_until_complete(shared_runner())
+        finally:
+            # calls a failed gather left behind must not resume inside the thread's next run
+            pending = asyncio.all_tasks(loop)
+
+            for task in pending:
+                task.cancel()
+
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+    async def runner():
+        async with AsyncBduDwService(**service_kwargs) as service:
+            return await handler(service)
+
+    # called from inside a running event loop, run on a private loop and client in another thread instead of nesting
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(contextvars.copy_context().run, asyncio.run, runner()).result()
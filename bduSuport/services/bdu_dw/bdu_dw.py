@@ -1,247 +1,309 @@
+import time
+import ijson
 import logging
-import requests
-from typing import List
-from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional
+from datetime import date, datetime, timedelta
 from decouple import config
 from requests.auth import HTTPBasicAuth
 
 from bduSuport.helpers.http import is_2xx
+from bduSuport.services.bdu_dw.async_bdu_dw import run_with_async_service
+from bduSuport.services.bdu_dw.cache import BduDwCache
+from bduSuport.services.bdu_dw.circuit_breaker import BduDwCircuitBreaker
+from bduSuport.services.bdu_dw.rate_limiter import MAX_WAITS, PRIORITY_INTERACTIVE, BduDwRateLimiter
+from bduSuport.services.bdu_dw.single_flight import BduDwSingleFlight
+from bduSuport.services.bdu_dw.telemetry import record_gateway_call
 from bduSuport.services.bdu_dw.dto import Attendance, BduStudentDto, StudentScore, TimeTable, StudentEvent, StudentClassification
-from bduSuport.services.bdu_dw.key_mapper import convert_keys, convert_list
-from bduSuport.services.bdu_dw.mapping_dicts import student_key_mapping, attendance_key_mapping, score_key_mapping, time_table_mapping, event_key_mapping, classification_key_mapping
+from bduSuport.services.bdu_dw.queries import ATTENDANCE_CHUNK_DAYS, DwQuery, clean_params, convert_row, convert_dataset, read_dataset, partition_by_student, split_date_range, merge_attendance_chunks, attendances_query, daily_attendances_query, students_query, student_query, student_scores_query, time_tables_query, student_events_query, academic_classifications_query
+from bduSuport.services.bdu_dw.session import VERIFY_SSL, get_session, get_timeout
+
+# ranges of up to this many chunks (or days of time tables) go through the pooled session one by one, an event loop
+# and an httpx client are only worth setting up for longer ones
+SYNC_MAX_CHUNKS = 2
 
 class BduDwService:
     __base_url = ""
     __username = ""
     __password = ""
+    __cache = None
+    __circuit_breaker = None
+    __single_flight = None
+    __rate_limiter = None
+    __use_cache = True
+    __priority = PRIORITY_INTERACTIVE
+    served_stale = False
+    served_partial = False
+
+    def __init__(self, use_cache: bool = True, priority: str = PRIORITY_INTERACTIVE):
+        """
+        use_cache=False skips cache reads so the caller always sees live data,
+        fresh responses are still written back to the cache.
+
+        Gateway calls take a token from the shared rate limiter first, background jobs pass
+        priority=PRIORITY_BATCH so they queue behind the requests of users of the mini app.
 
-    def __init__(self):
+        While the gateway is down (circuit open or a failed call) the last good copy of a dataset is
+        returned instead and served_stale is set, so views can tell the user the data may be outdated.
+        use_cache=False callers get no stale copy, the call fails as it would without a cache.
+        A dataset that could not be fetched at all comes back empty and sets served_partial.
+        """
         self.__base_url = config("BDU_DATA_WAREHOUSE_GATEWAY_BASE_URL")
         self.__username = config("BDU_DATA_WAREHOUSE_GATEWAY_USERNAME")
         self.__password = config("BDU_DATA_WAREHOUSE_GATEWAY_PASSWORD")
+        self.__cache = BduDwCache()
+        self.__circuit_breaker = BduDwCircuitBreaker()
+        self.__single_flight = BduDwSingleFlight()
+        self.__rate_limiter = BduDwRateLimiter(priority)
+        self.__use_cache = use_cache
+        self.__priority = priority
 
-    def get_attendances_by_student_code_and_date_range(self, student_code: int, date_start: date, date_end: date):
-        try:
-            resp = requests.get(
-                f"{self.__base_url}/dim_danh_sach_diem_danh_odp",
-                params={
-                    "mssv": student_code,
-                    "ngay_origin_start": date_start.strftime("%Y-%m-%d"),
-                    "ngay_origin_end": date_end.strftime("%Y-%m-%d"),
-                },
-                auth=HTTPBasicAuth(self.__username, self.__password),
-                verify=False
-            )
-
-            if not is_2xx(resp.status_code):
-                logging.getLogger().error("BduDwService.get_attendances_by_student_code_and_date_range status_code not is 2xx student_code=%s, content=%s", student_code, resp.text)
-                return []
-            
-            dataset = resp.json()
-
-            if not isinstance(dataset, list):
-                logging.getLogger().error("BduDwService.get_attendances_by_student_code_and_date_range response is not a list student_code=%s, content=%s", student_code, resp.text)
-                return []
-            
-            if len(dataset) == 0:
-                logging.getLogger().info("BduDwService.get_attendances_by_student_code_and_date_range response is empty student_code=%s, content=%s", student_code, resp.text)
-                return []
-            
-            converted_dataset = convert_list(dataset, attendance_key_mapping)
-            attendances = [Attendance(**converted_data) for converted_data in converted_dataset]
-            
-            return attendances
-        except Exception as e:
-            logging.getLogger().exception("BduDwService.get_attendances_by_student_code_and_date_range exc=%s, resp_content=%s", str(e), resp.text)
-            return []
+    def __run(self, query: DwQuery) -> list:
+        dataset = self.__fetch_dataset(query)
 
-    def get_students(self):
-        try:
-            resp = requests.get(
-                f"{self.__base_url}/fact_ho_so_sinh_vien_odp",
-                auth=HTTPBasicAuth(self.__username, self.__password),
-                verify=False
-            )
-
-            if not is_2xx(resp.status_code):
-                logging.getLogger().error("BduDwService.get_students status_code not is 2xx content=%s", resp.text)
-                return []
-            
-            dataset = resp.json()
-            converted_dataset = convert_list(dataset, student_key_mapping)
-            students = [BduStudentDto(**converted_data) for converted_data in converted_dataset]
-            
-            return students
-        except Exception as e:
-            logging.getLogger().exception("BduDwService.get_students exc=%s, resp_content=%s", str(e), resp.text)
-            return []
-    
-    def get_student(self, student_id: str):
-        try:
-            resp = requests.get(
-                f"{self.__base_url}/fact_ho_so_sinh_vien_odp",
-                params={
-                    "mssv": student_id
-                },
-                auth=HTTPBasicAuth(self.__username, self.__password),
-                verify=False
-            )
-
-            if not is_2xx(resp.status_code):
-                logging.getLogger().error("BduDwService.get_student status_code not is 2xx student_id=%s, content=%s", student_id, resp.text)
-                return None
-            
-            data = resp.json()
-
-            if not isinstance(data, list):
-                logging.getLogger().error("BduDwService.get_student response is not a list student_id=%s, content=%s", student_id, resp.text)
-                return None
-            
-            if len(data) == 0:
-                logging.getLogger().error("BduDwService.get_student response is empty student_id=%s, content=%s", student_id, resp.text)
-                return None
-            
-            student = convert_keys(data[0], student_key_mapping)
-            student_dto = BduStudentDto(**student)
-            
-            return student_dto
-        except Exception as e:
-            logging.getLogger().exception("BduDwService.get_student exc=%s, student_id=%s, resp_content=%s", str(e), student_id, resp.text)
+        if dataset is None:
+            self.served_partial = True
+
+        return convert_dataset("BduDwService", query, dataset)
+
+    def __fetch_dataset(self, query: DwQuery) -> Optional[list]:
+        if self.__use_cache and query.cache:
+            dataset = self.__cache.get(query.endpoint, query.params)
+
+            if dataset is not None:
+                return dataset
+
+        if not self.__circuit_breaker.allow_request():
+            logging.getLogger().warning("BduDwService.%s circuit open, skip gateway params=%s", query.method, query.params)
+            return self.__get_stale_dataset(query)
+
+        dataset = self.__request_coalesced(query)
+
+        if dataset is None:
+            return self.__get_stale_dataset(query)
+
+        if query.cache:
+            self.__cache.set(query.endpoint, query.params, dataset)
+
+        return dataset
+
+    def __request_coalesced(self, query: DwQuery) -> Optional[list]:
+        key = self.__cache.make_key(query.endpoint, query.params)
+        # the leader may wait for a rate limiter token before its request, the flight covers both
+        timeout = sum(get_timeout(query.endpoint, query.bulk)) + MAX_WAITS[self.__priority]
+
+        if self.__single_flight.acquire(key, timeout):
+            dataset = None
+
+            try:
+                dataset = self.__request_dataset(query)
+            finally:
+                self.__single_flight.publish(key, dataset)
+
+            return dataset
+
+        done, dataset = self.__single_flight.wait(key, timeout)
+
+        if done:
+            return dataset
+
+        return self.__request_dataset(query)
+
+    def __get_stale_dataset(self, query: DwQuery) -> Optional[list]:
+        # callers asking for live data get a failure rather than an old copy
+        if not self.__use_cache or not query.cache:
+            return None
+
+        dataset = self.__cache.get_stale(query.endpoint, query.params)
+
+        if dataset is not None:
+            self.served_stale = True
+
+        return dataset
+
+    def __get(self, query: DwQuery, stream: bool = False):
+        return get_session().get(
+            f"{self.__base_url}/{query.endpoint}",
+            params=clean_params(query.params),
+            auth=HTTPBasicAuth(self.__username, self.__password),
+            timeout=get_timeout(query.endpoint, query.bulk),
+            verify=VERIFY_SSL,
+            stream=stream,
+        )
+
+    def __request_dataset(self, query: DwQuery) -> Optional[list]:
+        resp = None
+
+        dataset = None
+
+        if not self.__rate_limiter.acquire(query.endpoint):
             return None
-        
-    def get_student_scores(self, student_code: str, semester: int, academic_year: int):
+
+        started_at = time.monotonic()
+
         try:
-            resp = requests.get(
-                f"{self.__base_url}/dim_bang_diem_odp",
-                params={
-                    "mssv": student_code,
-                    "nk": f"{academic_year}-{academic_year+1}",
-                    "hk": semester,
-                },
-                auth=HTTPBasicAuth(self.__username, self.__password),
-                verify=False
-            )
-
-            if not is_2xx(resp.status_code):
-                logging.getLogger().error("BduDwService.get_student_scores status_code not is 2xx student_code=%s, semester=%s, academic_year=%s, content=%s", student_code, semester, academic_year, resp.text)
-                return []
-            
-            dataset = resp.json()
-
-            if not isinstance(dataset, list):
-                logging.getLogger().error("BduDwService.get_student_scores response is not a list student_code=%s, semester=%s, academic_year=%s, content=%s", student_code, semester, academic_year, resp.text)
-                return []
-            
-            if len(dataset) == 0:
-                logging.getLogger().info("BduDwService.get_student_scores response is empty student_code=%s, semester=%s, academic_year=%s, content=%s", student_code, semester, academic_year, resp.text)
-                return []
-            
-            converted_dataset = convert_list(dataset, score_key_mapping)
-            scores = [StudentScore(**converted_data) for converted_data in converted_dataset]
-            
-            return scores
+            resp = self.__get(query)
+            self.__record_status(resp.status_code)
+            dataset = read_dataset("BduDwService", query, resp)
+
+            return dataset
         except Exception as e:
-            logging.getLogger().exception("BduDwService.get_student_scores exc=%s, resp_content=%s", str(e), resp.text)
-            return []
-        
-    def get_time_tables(self, student_code: str, date: date):
+            if resp is None:
+                self.__circuit_breaker.record_failure()
+
+            logging.getLogger().exception("BduDwService.%s exc=%s, params=%s, resp_content=%s", query.method, str(e), query.params, resp.text if resp is not None else None)
+            return None
+        finally:
+            record_gateway_call(time.monotonic() - started_at, dataset is None)
+
+    def __record_status(self, status_code: int):
+        if status_code >= 500:
+            self.__circuit_breaker.record_failure()
+        else:
+            self.__circuit_breaker.record_success()
+
+    def probe(self) -> bool:
+        """
+        Cheap health check used by probe_bdu_dw_gateway, it bypasses the cache, the circuit breaker and the rate limiter.
+        """
         try:
-            resp = requests.get(
-                f"{self.__base_url}/dim_thoi_khoa_bieu_odp",
-                params={
-                    "mssv": student_code,
-                    "ngay_hoc": date.strftime("%Y-%m-%d"),
-                },
-                auth=HTTPBasicAuth(self.__username, self.__password),
-                verify=False
-            )
-
-            if not is_2xx(resp.status_code):
-                logging.getLogger().error("BduDwService.get_time_tables status_code not is 2xx student_code=%s, date=%s, content=%s", student_code, date, resp.text)
-                return []
-            
-            dataset = resp.json()
-
-            if not isinstance(dataset, list):
-                logging.getLogger().error("BduDwService.get_time_tables response is not a list student_code=%s, date=%s, content=%s", student_code, date, resp.text)
-                return []
-            
-            if len(dataset) == 0:
-                logging.getLogger().info("BduDwService.get_time_tables response is empty student_code=%s, date=%s, content=%s", student_code, date, resp.text)
-                return []
-            
-            converted_dataset = convert_list(dataset, time_table_mapping)
-            time_tables = [TimeTable(**converted_data) for converted_data in converted_dataset]
-            
-            return time_tables
+            resp = self.__get(student_query("0"))
+
+            return resp.status_code < 500
         except Exception as e:
-            logging.getLogger().exception("BduDwService.get_time_tables exc=%s, resp_content=%s", str(e), resp.text)
-            return []
+            logging.getLogger().exception("BduDwService.probe exc=%s", str(e))
+            return False
+
+    def get_attendances_by_student_code_and_date_range(self, student_code: int, date_start: date, date_end: date) -> List[Attendance]:
+        return self.__run(attendances_query(student_code, date_start, date_end))
+
+    def get_attendances_by_date_range(self, student_code: int, date_start: date, date_end: date) -> List[Attendance]:
+        """
+        Any length of range, fetched as cacheable fixed size chunks concurrently (see AsyncBduDwService), sorted by date.
+        """
+        chunks = split_date_range(date_start, date_end, ATTENDANCE_CHUNK_DAYS)
+
+        if len(chunks) <= SYNC_MAX_CHUNKS:
+            results = [self.get_attendances_by_student_code_and_date_range(student_code, chunk_start, chunk_end) for chunk_start, chunk_end in chunks]
+
+            return list(merge_attendance_chunks(results, date_start, date_end))
+
+        async def fetch_attendances(service):
+            return await service.get_attendances_by_date_range(student_code, date_start, date_end), service.served_stale, service.served_partial
+
+        attendances, served_stale, served_partial = run_with_async_service(fetch_attendances, use_cache=self.__use_cache, priority=self.__priority)
+        self.served_stale = self.served_stale or served_stale
+        self.served_partial = self.served_partial or served_partial
+
+        return attendances
+
+    def get_attendances_by_date(self, attendance_date: date, student_codes: Optional[Iterable[int]] = None) -> Optional[Dict[int, List[Attendance]]]:
+        """
+        Fetches the attendances of every student on a day in a single gateway call and partitions
+        them by student code, restricted to student_codes when given. None means the call failed.
+        """
+        query = daily_attendances_query(attendance_date, attendance_date)
+        dataset = self.__fetch_dataset(query)
+
+        if dataset is None:
+            return None
+
+        student_codes = None if student_codes is None else list(student_codes)
+        partitions = partition_by_student(dataset, student_codes)
+        attendances = {code: convert_dataset("BduDwService", query, rows) for code, rows in partitions.items()}
+
+        for code in student_codes or []:
+            attendances.setdefault(int(code), [])
+
+        return attendances
+
+    def get_students(self, updated_since: Optional[datetime] = None) -> List[BduStudentDto]:
+        students = self.__run(students_query(updated_since))
+
+        if updated_since is None:
+            return students
+
+        return [student for student in students if student.updated_at is None or student.updated_at >= updated_since]
+
+    def iter_students(self, updated_since: Optional[datetime] = None) -> Iterator[BduStudentDto]:
+        """
+        Streams the student table, rows are parsed incrementally off the socket and yielded one DTO
+        at a time so a full export runs in constant memory. Rows that fail conversion are skipped,
+        a broken stream is raised so callers never mistake a truncated export for a complete one.
+        """
+        query = students_query(updated_since)
+
+        if not self.__circuit_breaker.allow_request():
+            raise Exception("data warehouse gateway circuit is open")
+
+        if not self.__rate_limiter.acquire(query.endpoint):
+            raise Exception("data warehouse gateway rate limit exceeded")
 
-    def get_student_events(self, student_code: str, nkhk: int):
         try:
-            resp = requests.get(
-                f"{self.__base_url}/dim_su_kien_odp",
-                params={
-                    "mssv": student_code,
-                    "nkhk": nkhk,
-                },
-                auth=HTTPBasicAuth(self.__username, self.__password),
-                verify=False
-            )
-
-            if not is_2xx(resp.status_code):
-                logging.getLogger().error("BduDwService.get_student_events status_code not is 2xx student_code=%s, nkhk=%s, content=%s", student_code, nkhk, resp.text)
-                return []
-            
-            dataset = resp.json()
-
-            if not isinstance(dataset, list):
-                logging.getLogger().error("BduDwService.get_student_events response is not a list student_code=%s, nkhk=%s, content=%s", student_code, nkhk, resp.text)
-                return []
-            
-            if len(dataset) == 0:
-                logging.getLogger().info("BduDwService.get_student_events response is empty student_code=%s, nkhk=%s, content=%s", student_code, nkhk, resp.text)
-                return []
-            
-            converted_dataset = convert_list(dataset, event_key_mapping)
-            events = [StudentEvent(**converted_data) for converted_data in converted_dataset]
-            
-            return events
+            started_at = time.monotonic()
+
+            with self.__get(query, stream=True) as resp:
+                # the export is streamed for minutes, its latency is the time to the response headers
+                record_gateway_call(time.monotonic() - started_at, resp.status_code >= 500)
+                self.__record_status(resp.status_code)
+
+                if not is_2xx(resp.status_code):
+                    logging.getLogger().error("BduDwService.iter_students status_code not is 2xx params=%s, content=%s", query.params, resp.text)
+                    return
+
+                resp.raw.decode_content = True
+
+                for row in ijson.items(resp.raw, "item", use_float=True):
+                    try:
+                        student = convert_row(query, row)
+                    except Exception as e:
+                        logging.getLogger().exception("BduDwService.iter_students convert row failed exc=%s, student_id=%s", str(e), row.get("mssv"))
+                        continue
+
+                    if updated_since is None or student.updated_at is None or student.updated_at >= updated_since:
+                        yield student
         except Exception as e:
-            logging.getLogger().exception("BduDwService.get_student_events exc=%s, resp_content=%s", str(e), resp.text)
-            return []
+            logging.getLogger().exception("BduDwService.iter_students exc=%s, params=%s", str(e), query.params)
+            raise e
+
+    def get_student(self, student_id: str) -> Optional[BduStudentDto]:
+        query = student_query(student_id)
+        dataset = self.__fetch_dataset(query)
+
+        if not dataset:
+            logging.getLogger().error("BduDwService.get_student student not found student_id=%s", student_id)
+            return None
+
+        students = convert_dataset("BduDwService", query, dataset[:1])
+
+        return students[0] if students else None
+
+    def get_student_scores(self, student_code: str, semester: int, academic_year: int) -> List[StudentScore]:
+        return self.__run(student_scores_query(student_code, semester, academic_year))
+
+    def get_time_tables(self, student_code: str, date: date) -> List[TimeTable]:
+        return self.__run(time_tables_query(student_code, date))
+
+    def get_time_tables_by_date_range(self, student_code: str, date_start: date, date_end: date) -> Dict[date, List[TimeTable]]:
+        """
+        The gateway filters time tables by a single ngay_hoc only, so the days are fetched concurrently
+        and each one is cached under the same key as get_time_tables, already cached days cost no call.
+        """
+        dates = [date_start + timedelta(days=i) for i in range((date_end - date_start).days + 1)]
+
+        if len(dates) <= SYNC_MAX_CHUNKS:
+            return {_date: self.get_time_tables(student_code, _date) for _date in dates}
+
+        async def fetch_time_tables(service):
+            return await service.get_time_tables_for_dates(student_code, dates), service.served_stale, service.served_partial
+
+        time_tables, served_stale, served_partial = run_with_async_service(fetch_time_tables, use_cache=self.__use_cache, priority=self.__priority)
+        self.served_stale = self.served_stale or served_stale
+        self.served_partial = self.served_partial or served_partial
+
+        return time_tables
+
+    def get_student_events(self, student_code: str, nkhk: int) -> List[StudentEvent]:
+        return self.__run(student_events_query(student_code, nkhk))
 
     def get_student_academic_classifications(self, student_code: str, date: date = None) -> List[StudentClassification]:
-        try:
-            resp = requests.get(
-                f"{self.__base_url}/dim_xep_loai_hoc_ki_odp",
-                params={
-                    "mssv": student_code,
-                    "date": date.strftime("%Y-%m-%d") if date else None,
-                },
-                auth=HTTPBasicAuth(self.__username, self.__password),
-                verify=False
-            )
-
-            if not is_2xx(resp.status_code):
-                logging.getLogger().error("BduDwService.get_student_academic_classifications status_code not is 2xx student_code=%s, content=%s", student_code, resp.text)
-                return []
-            
-            dataset = resp.json()
-
-            if not isinstance(dataset, list):
-                logging.getLogger().error("BduDwService.get_student_academic_classifications response is not a list student_code=%s, content=%s", student_code, resp.text)
-                return []
-            
-            if len(dataset) == 0:
-                logging.getLogger().info("BduDwService.get_student_academic_classifications response is empty student_code=%s, content=%s", student_code, resp.text)
-                return []
-            
-            converted_dataset = convert_list(dataset, classification_key_mapping)
-            classifications = [StudentClassification(**converted_data) for converted_data in converted_dataset]
-            
-            return classifications
-        except Exception as e:
-            logging.getLogger().exception("BduDwService.get_student_academic_classifications exc=%s, resp_content=%s", str(e), resp.text)
-            return []
\ No newline at end of file
+        return self.__run(academic_classifications_query(student_code, date))
@@ -0,0 +1,169 @@
+import json
+import hashlib
+import logging
+import datetime
+from typing import Dict, Optional
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# (ttl while the data can still change, ttl once it is closed), 0 disables caching
+DATASET_TTLS = {
+    "dim_danh_sach_diem_danh_odp": (10 * MINUTE, 7 * DAY),
+    "dim_thoi_khoa_bieu_odp": (1 * HOUR, 7 * DAY),
+    "dim_bang_diem_odp": (6 * HOUR, 30 * DAY),
+    "dim_su_kien_odp": (6 * HOUR, 30 * DAY),
+    "dim_xep_loai_hoc_ki_odp": (6 * HOUR, 1 * DAY),
+    "fact_ho_so_sinh_vien_odp": (1 * DAY, 1 * DAY),
+}
+
+# last good copy of every dataset, served while the gateway circuit is open
+STALE_TTL = 7 * DAY
+
+def parse_date(value) -> Optional[datetime.date]:
+    try:
+        return datetime.datetime.strptime(str(value), "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+def get_current_semester(today: datetime.date = None):
+    """
+    Returns (start year of the academic year, semester) of the running semester,
+    an academic year starts in August: semester 1 until December, 2 until May, 3 is the summer term.
+    """
+    today = today or datetime.date.today()
+
+    if today.month >= 8:
+        return today.year, 1
+
+    if today.month <= 5:
+        return today.year - 1, 2
+
+    return today.year - 1, 3
+
+def is_closed_semester(start_year: int, semester: int, today: datetime.date = None) -> bool:
+    return (start_year, semester) < get_current_semester(today)
+
+def is_closed(endpoint: str, params: dict, today: datetime.date = None) -> bool:
+    today = today or datetime.date.today()
+
+    try:
+        if endpoint == "dim_danh_sach_diem_danh_odp":
+            date_end = parse_date(params.get("ngay_origin_end"))
+            return date_end is not None and date_end < today
+
+        if endpoint == "dim_thoi_khoa_bieu_odp":
+            lesson_date = parse_date(params.get("ngay_hoc"))
+            return lesson_date is not None and lesson_date < today
+
+        if endpoint == "dim_xep_loai_hoc_ki_odp":
+            date = parse_date(params.get("date"))
+            return date is not None and date < today
+
+        if endpoint == "dim_bang_diem_odp":
+            start_year = int(str(params["nk"]).split("-")[0])
+            return is_closed_semester(start_year, int(params["hk"]), today)
+
+        if endpoint == "dim_su_kien_odp":
+            nkhk = str(params["nkhk"])
+            return is_closed_semester(int(nkhk[:2]) + 2000, int(nkhk[-1]), today)
+    except (KeyError, TypeError, ValueError):
+        return False
+
+    return False
+
+class BduDwCache:
+    prefix = "bdu_dw"
+    stats_key = "bdu_dw:cache:stats"
+
+    def normalize_params(self, params: dict) -> Dict[str, str]:
+        return {key: str(value) for key, value in sorted((params or {}).items()) if value is not None}
+
+    def make_key(self, endpoint: str, params: dict) -> str:
+        return f"{self.prefix}:data:{self.__make_dataset_id(endpoint, params)}"
+
+    def make_stale_key(self, endpoint: str, params: dict) -> str:
+        return f"{self.prefix}:stale:{self.__make_dataset_id(endpoint, params)}"
+
+    def get_ttl(self, endpoint: str, params: dict) -> int:
+        open_ttl, closed_ttl = DATASET_TTLS.get(endpoint, (0, 0))
+
+        if not params:
+            # unfiltered full table dumps are never cached
+            return 0
+
+        return closed_ttl if is_closed(endpoint, self.normalize_params(params)) else open_ttl
+
+    def get(self, endpoint: str, params: dict) -> Optional[list]:
+        try:
+            dataset = cache.get(self.make_key(endpoint, params))
+            self.__count(endpoint, "miss" if dataset is None else "hit")
+
+            return dataset
+        except Exception as e:
+            logging.getLogger().exception("BduDwCache.get exc=%s, endpoint=%s, params=%s", str(e), endpoint, params)
+            return None
+
+    def set(self, endpoint: str, params: dict, dataset: list):
+        try:
+            ttl = self.get_ttl(endpoint, params)
+
+            if ttl > 0:
+                cache.set(self.make_key(endpoint, params), dataset, ttl)
+                cache.set(self.make_stale_key(endpoint, params), dataset, max(ttl, STALE_TTL))
+        except Exception as e:
+            logging.getLogger().exception("BduDwCache.set exc=%s, endpoint=%s, params=%s", str(e), endpoint, params)
+
+    def get_stale(self, endpoint: str, params: dict) -> Optional[list]:
+        try:
+            dataset = cache.get(self.make_stale_key(endpoint, params))
+            self.__count(endpoint, "stale" if dataset is not None else "miss")
+
+            return dataset
+        except Exception as e:
+            logging.getLogger().exception("BduDwCache.get_stale exc=%s, endpoint=%s, params=%s", str(e), endpoint, params)
+            return None
+
+    def invalidate(self, endpoint: str = None, student_code=None, flush_stale: bool = False) -> int:
+        """
+        Drops every cached dataset of an endpoint and/or a student, no arguments flushes the whole DW cache.
+        Stale copies are kept unless flush_stale is set.
+        """
+        # datasets and stale copies have their own namespaces, the patterns never reach the other bdu_dw keys (flights, circuit...)
+        pattern = f"{endpoint or '*'}:{student_code if student_code is not None else '*'}:*"
+        num_deleted = cache.delete_pattern(f"{self.prefix}:data:{pattern}")
+
+        if flush_stale:
+            num_deleted = num_deleted + cache.delete_pattern(f"{self.prefix}:stale:{pattern}")
+
+        return num_deleted
+
+    def invalidate_query(self, endpoint: str, params: dict) -> bool:
+        return cache.delete(self.make_key(endpoint, params))
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        stats = {}
+
+        for field, value in get_redis_connection("default").hgetall(self.stats_key).items():
+            endpoint, _, kind = field.decode().rpartition(":")
+            stats.setdefault(endpoint, {"hit": 0, "miss": 0, "stale": 0})[kind] = int(value)
+
+        return stats
+
+    def reset_stats(self):
+        get_redis_connection("default").delete(self.stats_key)
+
+    def __make_dataset_id(self, endpoint: str, params: dict) -> str:
+        normalized = self.normalize_params(params)
+        digest = hashlib.sha1(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+        return f"{endpoint}:{normalized.get('mssv', '_')}:{digest}"
+
+    def __count(self, endpoint: str, kind: str):
+        try:
+            get_redis_connection("default").hincrby(self.stats_key, f"{endpoint}:{kind}", 1)
+        except Exception as e:
+            logging.getLogger().exception("BduDwCache.count exc=%s, endpoint=%s, kind=%s", str(e), endpoint, kind)
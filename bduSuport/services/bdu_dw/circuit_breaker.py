@@ -0,0 +1,106 @@
+import time
+import logging
+from decouple import config
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+# calls a window needs before its failure ratio is trusted, fewer never open the circuit
+MIN_REQUESTS = config("BDU_DATA_WAREHOUSE_GATEWAY_CIRCUIT_MIN_REQUESTS", 10, cast=int)
+FAILURE_RATIO = config("BDU_DATA_WAREHOUSE_GATEWAY_CIRCUIT_FAILURE_RATIO", 0.5, cast=float)
+FAILURE_WINDOW = config("BDU_DATA_WAREHOUSE_GATEWAY_CIRCUIT_FAILURE_WINDOW", 60, cast=int)
+COOLDOWN = config("BDU_DATA_WAREHOUSE_GATEWAY_CIRCUIT_COOLDOWN", 30, cast=int)
+PROBE_LOCK_TTL = 60
+
+# Counts a call (and a failure, ARGV[1] = 1) in the current window, the window starts with its first call.
+RECORD_SCRIPT = """
+local num_requests = redis.call('HINCRBY', KEYS[1], 'requests', 1)
+local num_failures = redis.call('HINCRBY', KEYS[1], 'failures', tonumber(ARGV[1]))
+
+if redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+end
+
+return {num_requests, num_failures}
+"""
+
+class BduDwCircuitBreaker:
+    """
+    Gateway circuit breaker shared by every web and worker process through Redis.
+
+    Once `MIN_REQUESTS` calls were made within `FAILURE_WINDOW` seconds, a share of failed calls of at least
+    `FAILURE_RATIO` opens the circuit, callers then short-circuit without touching the gateway. Successes count
+    too, so a few errors among the thousands of calls of a batch fan-out do not trip it for everyone, while a
+    gateway failing every other call still does. Once `COOLDOWN` seconds have passed a single
+    probe_bdu_dw_gateway task is dispatched, only its outcome closes the circuit (or re-arms the cooldown).
+    """
+    open_key = "bdu_dw:circuit:opened_at"
+    cooldown_key = "bdu_dw:circuit:cooldown"
+    window_key = "bdu_dw:circuit:window"
+    probe_key = "bdu_dw:circuit:probe"
+
+    def is_open(self) -> bool:
+        try:
+            return cache.get(self.open_key) is not None
+        except Exception as e:
+            logging.getLogger().exception("BduDwCircuitBreaker.is_open exc=%s", str(e))
+            return False
+
+    def allow_request(self) -> bool:
+        if not self.is_open():
+            return True
+
+        self.__schedule_probe()
+
+        return False
+
+    def record_success(self):
+        try:
+            self.__record(failed=False)
+        except Exception as e:
+            logging.getLogger().exception("BduDwCircuitBreaker.record_success exc=%s", str(e))
+
+    def record_failure(self):
+        try:
+            num_requests, num_failures = self.__record(failed=True)
+
+            if num_requests >= MIN_REQUESTS and num_failures >= num_requests * FAILURE_RATIO and not self.is_open():
+                self.open()
+        except Exception as e:
+            logging.getLogger().exception("BduDwCircuitBreaker.record_failure exc=%s", str(e))
+
+    def open(self):
+        logging.getLogger().error("BduDwCircuitBreaker.open data warehouse gateway circuit opened")
+        cache.set(self.open_key, time.time(), None)
+        cache.set(self.cooldown_key, 1, COOLDOWN)
+
+    def close(self):
+        logging.getLogger().info("BduDwCircuitBreaker.close data warehouse gateway circuit closed")
+        cache.delete_many([self.open_key, self.cooldown_key])
+        get_redis_connection("default").delete(self.window_key)
+
+    def probe_finished(self, healthy: bool):
+        if healthy:
+            self.close()
+        else:
+            cache.set(self.cooldown_key, 1, COOLDOWN)
+
+        cache.delete(self.probe_key)
+
+    def __record(self, failed: bool):
+        script = get_redis_connection("default").register_script(RECORD_SCRIPT)
+        num_requests, num_failures = script(keys=[self.window_key], args=[1 if failed else 0, FAILURE_WINDOW])
+
+        return int(num_requests), int(num_failures)
+
+    def __schedule_probe(self):
+        try:
+            if cache.get(self.cooldown_key) is not None:
+                return
+
+            if not cache.add(self.probe_key, 1, PROBE_LOCK_TTL):
+                return
+
+            from bduSuport.tasks.bg_tasks import probe_bdu_dw_gateway
+            probe_bdu_dw_gateway.delay()
+        except Exception as e:
+            logging.getLogger().exception("BduDwCircuitBreaker.schedule_probe exc=%s", str(e))
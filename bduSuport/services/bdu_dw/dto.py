@@ -1,7 +1,53 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from datetime import datetime, date
+from functools import lru_cache
 from typing import List, Optional
 
+HTTP_DATETIME_FORMAT = "%a, %d %b %Y %H:%M:%S %Z"
+MONTHS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6, "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+
+@lru_cache(maxsize=16384)
+def parse_http_datetime(value: str) -> datetime:
+    """
+    Parses the gateway dates ("Mon, 02 Sep 2024 10:00:00 GMT") by slicing instead of strptime,
+    the same timestamps repeat across rows so results are memoized. Anything unusual goes through strptime.
+    """
+    try:
+        if len(value) == 29 and value[3] == ",":
+            return datetime(int(value[12:16]), MONTHS[value[8:11]], int(value[5:7]), int(value[17:19]), int(value[20:22]), int(value[23:25]))
+    except (KeyError, ValueError):
+        pass
+
+    return datetime.strptime(value, HTTP_DATETIME_FORMAT)
+
+@lru_cache(maxsize=4096)
+def parse_iso_date(value: str) -> date:
+    try:
+        if len(value) == 10 and value[4] == "-" and value[7] == "-":
+            return date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+    except ValueError:
+        pass
+
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def slotted(cls):
+    """
+    Rebuilds a dataclass with __slots__ (dataclass(slots=True) needs python 3.10), records
+    then carry no per-instance __dict__. Field defaults live on the generated __init__.
+    """
+    field_names = tuple(_field.name for _field in fields(cls))
+    cls_dict = {key: value for key, value in cls.__dict__.items() if key not in field_names and key not in ("__dict__", "__weakref__")}
+    cls_dict["__slots__"] = field_names
+
+    return type(cls)(cls.__name__, cls.__bases__, cls_dict)
+
+def dto_to_dict(dto) -> dict:
+    """
+    Shallow field dump for JSON responses, much cheaper than dataclasses.asdict which deep copies every value.
+    """
+    return {name: getattr(dto, name) for name in dto.__slots__}
+
+@slotted
 @dataclass
 class BduStudentDto:
     id_card: str = ""
@@ -36,10 +82,11 @@ class BduStudentDto:
     updated_at: Optional[datetime] = field(default=None)
 
     def __post_init__(self):
-        setattr(self, "created_at", datetime.strptime(self.created_at, "%a, %d %b %Y %H:%M:%S %Z"))
-        setattr(self, "updated_at", datetime.strptime(self.updated_at, "%a, %d %b %Y %H:%M:%S %Z"))
-        setattr(self, "date_of_birth", datetime.strptime(self.date_of_birth, "%a, %d %b %Y %H:%M:%S %Z").date())
+        setattr(self, "created_at", parse_http_datetime(self.created_at))
+        setattr(self, "updated_at", parse_http_datetime(self.updated_at))
+        setattr(self, "date_of_birth", parse_http_datetime(self.date_of_birth).date())
 
+@slotted
 @dataclass
 class Attendance:
     lesson: str = ""
@@ -55,11 +102,12 @@ class Attendance:
     updated_at: Optional[datetime] = field(default=None)
 
     def __post_init__(self):
-        setattr(self, "created_at", datetime.strptime(self.created_at, "%a, %d %b %Y %H:%M:%S %Z"))
-        setattr(self, "updated_at", datetime.strptime(self.updated_at, "%a, %d %b %Y %H:%M:%S %Z"))
-        setattr(self, "attendance_datetime", datetime.strptime(self.attendance_datetime, "%a, %d %b %Y %H:%M:%S %Z"))
-        setattr(self, "attendance_date", datetime.strptime(self.attendance_date, "%Y-%m-%d").date())
+        setattr(self, "created_at", parse_http_datetime(self.created_at))
+        setattr(self, "updated_at", parse_http_datetime(self.updated_at))
+        setattr(self, "attendance_datetime", parse_http_datetime(self.attendance_datetime))
+        setattr(self, "attendance_date", parse_iso_date(self.attendance_date))
 
+@slotted
 @dataclass
 class StudentScore:
     student_id: int = 0
@@ -85,9 +133,10 @@ class StudentScore:
     updated_at: Optional[datetime] = field(default=None)
 
     def __post_init__(self):
-        setattr(self, "created_at", datetime.strptime(self.created_at, "%a, %d %b %Y %H:%M:%S %Z"))
-        setattr(self, "updated_at", datetime.strptime(self.updated_at, "%a, %d %b %Y %H:%M:%S %Z"))
+        setattr(self, "created_at", parse_http_datetime(self.created_at))
+        setattr(self, "updated_at", parse_http_datetime(self.updated_at))
 
+@slotted
 @dataclass
 class TimeTable:
     lesson_number: int = 0
@@ -110,7 +159,7 @@ class TimeTable:
     def __post_init__(self):
         if isinstance(self.lesson_date, str):
             try:
-                self.lesson_date = datetime.strptime(self.lesson_date, "%a, %d %b %Y %H:%M:%S %Z").date()
+                self.lesson_date = parse_http_datetime(self.lesson_date).date()
             except ValueError:
                 pass
         
@@ -131,6 +180,7 @@ class TimeTable:
         if isinstance(self.lesson_number, str) and self.lesson_number.isdigit():
             self.lesson_number = int(self.lesson_number)
 
+@slotted
 @dataclass
 class StudentEvent:
     id: int = 0
@@ -144,11 +194,11 @@ class StudentEvent:
     def __post_init__(self):
         if isinstance(self.event_date, str) and self.event_date:
             try:
-                from datetime import datetime
-                self.event_date = datetime.strptime(self.event_date, "%a, %d %b %Y %H:%M:%S %Z")
+                self.event_date = parse_http_datetime(self.event_date)
             except Exception:
                 pass
 
+@slotted
 @dataclass
 class StudentClassification:
     date: str = ""
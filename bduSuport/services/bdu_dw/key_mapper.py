@@ -1,3 +1,6 @@
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Tuple
+
 def convert_keys(data: dict, key_mapping: dict) -> dict:
     converted_data = {}
     for key, value in data.items():
@@ -8,3 +11,57 @@ def convert_keys(data: dict, key_mapping: dict) -> dict:
 
 def convert_list(data: list, key_mapping: dict) -> list:
     return [convert_keys(item, key_mapping) for item in data]
+
+def compile_constructor(dto_class: type, field_names: Iterable[str], keys: Iterable) -> Callable:
+    """
+    Generates `def construct(row): return dto_class(field_a=row[key_a], ...)` once, the keyword
+    arguments are spelled out so a call does no dict building or key scanning of its own.
+    """
+    arguments = ", ".join(f"{field_name}=row[{key!r}]" for field_name, key in zip(field_names, keys))
+    namespace = {"dto_class": dto_class}
+    exec(f"def construct(row):\n    return dto_class({arguments})\n", namespace)
+
+    return namespace["construct"]
+
+class RowTransformer:
+    """
+    A key mapping compiled against its DTO class: only the mapped source keys of a row are read
+    and the DTO is built in one call, replacing convert_list + dto_class(**converted_data).
+    """
+    def __init__(self, key_mapping: dict, dto_class: type):
+        self.key_mapping = key_mapping
+        self.dto_class = dto_class
+        self.__construct = compile_constructor(dto_class, key_mapping.values(), key_mapping.keys())
+
+    def __call__(self, row: dict):
+        try:
+            return self.__construct(row)
+        except KeyError:
+            # rows missing some columns keep the DTO defaults for them
+            return self.dto_class(**convert_keys(row, self.key_mapping))
+
+    def transform_rows(self, rows: Iterable[dict]) -> list:
+        rows = rows if isinstance(rows, list) else list(rows)
+        construct = self.__construct
+
+        try:
+            return [construct(row) for row in rows]
+        except KeyError:
+            return [self(row) for row in rows]
+
+    def transform_columns(self, columns: Dict[str, list]) -> List:
+        """
+        Builds DTOs from a column oriented payload ({"mssv": [...], "ngay": [...]}) in a single pass.
+        """
+        present = tuple(src for src in self.key_mapping if src in columns)
+
+        if not present:
+            return []
+
+        construct = self.__column_constructor(present)
+
+        return [construct(values) for values in zip(*(columns[src] for src in present))]
+
+    @lru_cache(maxsize=8)
+    def __column_constructor(self, present: Tuple[str, ...]) -> Callable:
+        return compile_constructor(self.dto_class, (self.key_mapping[src] for src in present), range(len(present)))
@@ -0,0 +1,204 @@
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from collections import defaultdict
+from decouple import config
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bduSuport.helpers.http import is_2xx
+from bduSuport.services.bdu_dw.dto import Attendance, BduStudentDto, StudentScore, TimeTable, StudentEvent, StudentClassification
+from bduSuport.services.bdu_dw.key_mapper import RowTransformer
+from bduSuport.services.bdu_dw.mapping_dicts import student_key_mapping, attendance_key_mapping, score_key_mapping, time_table_mapping, event_key_mapping, classification_key_mapping
+
+attendance_transformer = RowTransformer(attendance_key_mapping, Attendance)
+student_transformer = RowTransformer(student_key_mapping, BduStudentDto)
+score_transformer = RowTransformer(score_key_mapping, StudentScore)
+time_table_transformer = RowTransformer(time_table_mapping, TimeTable)
+event_transformer = RowTransformer(event_key_mapping, StudentEvent)
+classification_transformer = RowTransformer(classification_key_mapping, StudentClassification)
+
+# 7 keeps the attendance chunks on Monday - Sunday weeks
+ATTENDANCE_CHUNK_DAYS = config("BDU_DATA_WAREHOUSE_ATTENDANCE_CHUNK_DAYS", 7, cast=int)
+
+@dataclass
+class DwQuery:
+    method: str
+    endpoint: str
+    params: Optional[dict]
+    transformer: RowTransformer
+    bulk: bool = False
+    cache: bool = True
+
+def attendances_query(student_code: int, date_start: date, date_end: date) -> DwQuery:
+    return DwQuery(
+        method="get_attendances_by_student_code_and_date_range",
+        endpoint="dim_danh_sach_diem_danh_odp",
+        params={
+            "mssv": student_code,
+            "ngay_origin_start": date_start.strftime("%Y-%m-%d"),
+            "ngay_origin_end": date_end.strftime("%Y-%m-%d"),
+        },
+        transformer=attendance_transformer,
+    )
+
+def daily_attendances_query(date_start: date, date_end: date) -> DwQuery:
+    return DwQuery(
+        method="get_attendances_by_date",
+        endpoint="dim_danh_sach_diem_danh_odp",
+        params={
+            "ngay_origin_start": date_start.strftime("%Y-%m-%d"),
+            "ngay_origin_end": date_end.strftime("%Y-%m-%d"),
+        },
+        transformer=attendance_transformer,
+        bulk=True,
+    )
+
+def students_query(updated_since: Optional[datetime] = None) -> DwQuery:
+    return DwQuery(
+        method="get_students",
+        endpoint="fact_ho_so_sinh_vien_odp",
+        # the gateway filters a column with <column>_start/<column>_end, as it does for ngay_origin
+        params={"updated_at_start": updated_since.strftime("%Y-%m-%d %H:%M:%S")} if updated_since else None,
+        transformer=student_transformer,
+        bulk=True,
+        cache=False,
+    )
+
+def student_query(student_id: str) -> DwQuery:
+    return DwQuery(
+        method="get_student",
+        endpoint="fact_ho_so_sinh_vien_odp",
+        params={"mssv": student_id},
+        transformer=student_transformer,
+    )
+
+def student_scores_query(student_code: str, semester: int, academic_year: int) -> DwQuery:
+    return DwQuery(
+        method="get_student_scores",
+        endpoint="dim_bang_diem_odp",
+        params={
+            "mssv": student_code,
+            "nk": f"{academic_year}-{academic_year+1}",
+            "hk": semester,
+        },
+        transformer=score_transformer,
+    )
+
+def time_tables_query(student_code: str, date: date) -> DwQuery:
+    return DwQuery(
+        method="get_time_tables",
+        endpoint="dim_thoi_khoa_bieu_odp",
+        params={
+            "mssv": student_code,
+            "ngay_hoc": date.strftime("%Y-%m-%d"),
+        },
+        transformer=time_table_transformer,
+    )
+
+def student_events_query(student_code: str, nkhk: int) -> DwQuery:
+    return DwQuery(
+        method="get_student_events",
+        endpoint="dim_su_kien_odp",
+        params={
+            "mssv": student_code,
+            "nkhk": nkhk,
+        },
+        transformer=event_transformer,
+    )
+
+def academic_classifications_query(student_code: str, date: date = None) -> DwQuery:
+    return DwQuery(
+        method="get_student_academic_classifications",
+        endpoint="dim_xep_loai_hoc_ki_odp",
+        params={
+            "mssv": student_code,
+            "date": date.strftime("%Y-%m-%d") if date else None,
+        },
+        transformer=classification_transformer,
+    )
+
+def split_date_range(date_start: date, date_end: date, chunk_days: int) -> List[Tuple[date, date]]:
+    """
+    Covers [date_start, date_end] with chunk_days long chunks aligned on the proleptic ordinal (day 1 is a Monday),
+    a chunk is the same whichever range it is part of so its cache key is shared between requests.
+    """
+    chunk_start = date.fromordinal((date_start.toordinal() - 1) // chunk_days * chunk_days + 1)
+    chunks = []
+
+    while chunk_start <= date_end:
+        chunk_end = chunk_start + timedelta(days=chunk_days - 1)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + timedelta(days=1)
+
+    return chunks
+
+def merge_attendance_chunks(chunks: Iterable[List[Attendance]], date_start: date, date_end: date) -> Iterator[Attendance]:
+    """
+    Yields the attendances of consecutive chunks sorted by date, trimming the days of the outer chunks
+    that fall outside [date_start, date_end].
+    """
+    for chunk in chunks:
+        attendances = [
+            attendance for attendance in chunk
+            if attendance.attendance_date is None or date_start <= attendance.attendance_date <= date_end
+        ]
+
+        yield from sorted(attendances, key=lambda attendance: attendance.attendance_date or date_start)
+
+def clean_params(params: Optional[dict]) -> Optional[dict]:
+    if params is None:
+        return None
+
+    return {key: value for key, value in params.items() if value is not None}
+
+def read_dataset(service_name: str, query: DwQuery, resp) -> Optional[list]:
+    """
+    Validates a gateway response (requests or httpx, both expose status_code/text/json())
+    and returns its rows, None means the call failed.
+    """
+    if not is_2xx(resp.status_code):
+        logging.getLogger().error("%s.%s status_code not is 2xx params=%s, content=%s", service_name, query.method, query.params, resp.text)
+        return None
+
+    dataset = resp.json()
+
+    if not isinstance(dataset, list):
+        logging.getLogger().error("%s.%s response is not a list params=%s, content=%s", service_name, query.method, query.params, resp.text)
+        return None
+
+    if len(dataset) == 0:
+        logging.getLogger().info("%s.%s response is empty params=%s", service_name, query.method, query.params)
+
+    return dataset
+
+def partition_by_student(dataset: list, student_codes: Optional[Iterable[int]] = None, student_key: str = "mssv") -> Dict[int, list]:
+    """
+    Groups raw rows by student code, rows of students outside student_codes are dropped
+    before any conversion work is spent on them.
+    """
+    wanted = None if student_codes is None else {int(code) for code in student_codes}
+    partitions = defaultdict(list)
+
+    for row in dataset:
+        try:
+            code = int(row.get(student_key))
+        except (TypeError, ValueError):
+            continue
+
+        if wanted is None or code in wanted:
+            partitions[code].append(row)
+
+    return dict(partitions)
+
+def convert_row(query: DwQuery, row: dict):
+    return query.transformer(row)
+
+def convert_dataset(service_name: str, query: DwQuery, dataset: Optional[list]) -> list:
+    if not dataset:
+        return []
+
+    try:
+        return query.transformer.transform_rows(dataset)
+    except Exception as e:
+        logging.getLogger().exception("%s.%s convert dataset failed exc=%s, params=%s", service_name, query.method, str(e), query.params)
+        return []
@@ -0,0 +1,122 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Tuple
+from decouple import config, Csv
+from django_redis import get_redis_connection
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+
+DEFAULT_RATE = config("BDU_DATA_WAREHOUSE_GATEWAY_RATE", 20, cast=float)
+DEFAULT_BURST = config("BDU_DATA_WAREHOUSE_GATEWAY_BURST", 40, cast=float)
+# share of every bucket batch jobs may not take, it is kept for users of the mini app
+BATCH_RESERVE = config("BDU_DATA_WAREHOUSE_GATEWAY_BATCH_RESERVE", 0.3, cast=float)
+# how long a caller may wait for a token before the call is given up
+MAX_WAITS = {
+    PRIORITY_INTERACTIVE: config("BDU_DATA_WAREHOUSE_GATEWAY_INTERACTIVE_MAX_WAIT", 2, cast=float),
+    PRIORITY_BATCH: config("BDU_DATA_WAREHOUSE_GATEWAY_BATCH_MAX_WAIT", 120, cast=float),
+}
+
+# Per endpoint budgets, e.g. "dim_danh_sach_diem_danh_odp=10/20,fact_ho_so_sinh_vien_odp=2/4" (requests per second/burst)
+ENDPOINT_RATE_LIMITS = config("BDU_DATA_WAREHOUSE_GATEWAY_RATE_LIMITS", "", cast=Csv())
+
+# Refills the bucket for the time elapsed (Redis clock, shared by every process) and takes a token
+# if more than `reserve` would be left, returns the seconds to wait before trying again otherwise.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+local wait = 0
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+if tokens - 1 >= reserve then
+    tokens = tokens - 1
+else
+    wait = (reserve + 1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+
+return tostring(wait)
+"""
+
+def parse_endpoint_rate_limits(items) -> Dict[str, Tuple[float, float]]:
+    rate_limits = {}
+
+    for item in items:
+        endpoint, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        rate_limits[endpoint.strip()] = (float(rate), float(burst or rate))
+
+    return rate_limits
+
+_endpoint_rate_limits = parse_endpoint_rate_limits(ENDPOINT_RATE_LIMITS)
+
+def get_rate_limit(endpoint: str) -> Tuple[float, float]:
+    return _endpoint_rate_limits.get(endpoint, (DEFAULT_RATE, DEFAULT_BURST))
+
+class BduDwRateLimiter:
+    """
+    Token buckets in Redis, one per gateway dataset, shared by every web and worker process.
+    Batch callers can only take tokens above BATCH_RESERVE of the bucket, so a cron job draining
+    a dataset still leaves room for interactive requests.
+    """
+    prefix = "bdu_dw:rate"
+
+    def __init__(self, priority: str = PRIORITY_INTERACTIVE):
+        self.__priority = priority
+
+    def try_acquire(self, endpoint: str) -> float:
+        """
+        Takes a token, returns 0 on success or the seconds to wait before a token can be available.
+        """
+        rate, burst = get_rate_limit(endpoint)
+        reserve = burst * BATCH_RESERVE if self.__priority == PRIORITY_BATCH else 0
+
+        try:
+            script = get_redis_connection("default").register_script(TOKEN_BUCKET_SCRIPT)
+            return float(script(keys=[f"{self.prefix}:{endpoint}"], args=[rate, burst, reserve]))
+        except Exception as e:
+            # the limiter never takes the gateway down with it
+            logging.getLogger().exception("BduDwRateLimiter.try_acquire exc=%s, endpoint=%s", str(e), endpoint)
+            return 0
+
+    def acquire(self, endpoint: str) -> bool:
+        deadline = time.monotonic() + MAX_WAITS[self.__priority]
+
+        while True:
+            wait = self.try_acquire(endpoint)
+
+            if wait <= 0:
+                return True
+
+            if time.monotonic() + wait > deadline:
+                logging.getLogger().warning("BduDwRateLimiter.acquire rate limited endpoint=%s, priority=%s", endpoint, self.__priority)
+                return False
+
+            time.sleep(wait)
+
+    async def acquire_async(self, endpoint: str) -> bool:
+        deadline = time.monotonic() + MAX_WAITS[self.__priority]
+        loop = asyncio.get_event_loop()
+
+        while True:
+            # the Redis round trip is blocking, it runs on the default executor to keep the loop serving other requests
+            wait = await loop.run_in_executor(None, self.try_acquire, endpoint)
+
+            if wait <= 0:
+                return True
+
+            if time.monotonic() + wait > deadline:
+                logging.getLogger().warning("BduDwRateLimiter.acquire_async rate limited endpoint=%s, priority=%s", endpoint, self.__priority)
+                return False
+
+            await asyncio.sleep(wait)
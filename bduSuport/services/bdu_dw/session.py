@@ -0,0 +1,101 @@
+import os
+import random
+import threading
+import requests
+from typing import Dict, Tuple
+from decouple import config, Csv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_CONNECT_TIMEOUT = config("BDU_DATA_WAREHOUSE_GATEWAY_CONNECT_TIMEOUT", 3.05, cast=float)
+DEFAULT_READ_TIMEOUT = config("BDU_DATA_WAREHOUSE_GATEWAY_READ_TIMEOUT", 15, cast=float)
+BULK_READ_TIMEOUT = config("BDU_DATA_WAREHOUSE_GATEWAY_BULK_READ_TIMEOUT", 120, cast=float)
+MAX_RETRIES = config("BDU_DATA_WAREHOUSE_GATEWAY_MAX_RETRIES", 2, cast=int)
+BACKOFF_FACTOR = config("BDU_DATA_WAREHOUSE_GATEWAY_BACKOFF_FACTOR", 0.3, cast=float)
+POOL_MAXSIZE = config("BDU_DATA_WAREHOUSE_GATEWAY_POOL_MAXSIZE", 20, cast=int)
+VERIFY_SSL = config("BDU_DATA_WAREHOUSE_GATEWAY_VERIFY_SSL", False, cast=bool)
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Per endpoint timeouts, e.g. "dim_bang_diem_odp=3/30,dim_su_kien_odp=3/10" (connect/read seconds)
+ENDPOINT_TIMEOUTS = config("BDU_DATA_WAREHOUSE_GATEWAY_TIMEOUTS", "", cast=Csv())
+
+class JitteredRetry(Retry):
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+
+        if backoff <= 0:
+            return 0
+
+        return random.uniform(backoff / 2, backoff)
+
+def get_backoff_time(retry_number: int) -> float:
+    backoff = BACKOFF_FACTOR * (2 ** (retry_number - 1))
+    return random.uniform(backoff / 2, backoff)
+
+def parse_endpoint_timeouts(items) -> Dict[str, Tuple[float, float]]:
+    timeouts = {}
+
+    for item in items:
+        endpoint, _, value = item.partition("=")
+        connect, _, read = value.partition("/")
+        timeouts[endpoint.strip()] = (float(connect), float(read or DEFAULT_READ_TIMEOUT))
+
+    return timeouts
+
+_endpoint_timeouts = parse_endpoint_timeouts(ENDPOINT_TIMEOUTS)
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def get_timeout(endpoint: str, bulk: bool = False) -> Tuple[float, float]:
+    connect, read = _endpoint_timeouts.get(endpoint, (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT))
+
+    if bulk:
+        read = max(read, BULK_READ_TIMEOUT)
+
+    return connect, read
+
+def build_session() -> requests.Session:
+    retry = JitteredRetry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        # a read timeout means the gateway is slow, retrying it only multiplies the wait
+        read=0,
+        status=MAX_RETRIES,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET"]),
+        backoff_factor=BACKOFF_FACTOR,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    })
+
+    return session
+
+def get_session() -> requests.Session:
+    """
+    Returns the process wide gateway session, a forked worker (gunicorn, celery prefork)
+    builds its own one so pooled sockets are never shared between processes.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+
+    if _session is not None and _session_pid == pid:
+        return _session
+
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            _session = build_session()
+            _session_pid = pid
+
+    return _session
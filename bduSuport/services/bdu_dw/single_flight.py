@@ -0,0 +1,85 @@
+import time
+import asyncio
+import logging
+from typing import Optional, Tuple
+from decouple import config
+from django.core.cache import cache
+
+POLL_INTERVAL = config("BDU_DATA_WAREHOUSE_GATEWAY_FLIGHT_POLL_INTERVAL", 0.05, cast=float)
+# followers reusing a flight may read a result up to this old
+RESULT_TTL = 5
+
+class BduDwSingleFlight:
+    """
+    Coalesces identical gateway queries across processes: the first caller of a key takes a short
+    Redis lock and fetches, callers arriving meanwhile poll for the published result instead of
+    sending the same request. A follower whose leader vanished or ran past the timeout fetches itself.
+    """
+    prefix = "bdu_dw:flight"
+
+    def acquire(self, key: str, timeout: float) -> bool:
+        try:
+            # the lock outlives the leader's request timeout so followers never race a slow fetch
+            if not cache.add(f"{self.prefix}:{key}:lock", 1, int(timeout) + 5):
+                return False
+
+            cache.delete(f"{self.prefix}:{key}:result")
+
+            return True
+        except Exception as e:
+            logging.getLogger().exception("BduDwSingleFlight.acquire exc=%s, key=%s", str(e), key)
+            return True
+
+    def publish(self, key: str, dataset: Optional[list]):
+        """
+        Hands the leader's result to its followers, None tells them the fetch failed.
+        """
+        try:
+            cache.set(f"{self.prefix}:{key}:result", {"dataset": dataset}, RESULT_TTL)
+            cache.delete(f"{self.prefix}:{key}:lock")
+        except Exception as e:
+            logging.getLogger().exception("BduDwSingleFlight.publish exc=%s, key=%s", str(e), key)
+
+    def poll(self, key: str) -> Tuple[bool, bool, Optional[list]]:
+        """
+        Returns (running, done, dataset) of the flight.
+        """
+        running = cache.get(f"{self.prefix}:{key}:lock") is not None
+        result = cache.get(f"{self.prefix}:{key}:result")
+
+        if result is not None:
+            return running, True, result["dataset"]
+
+        return running, False, None
+
+    def wait(self, key: str, timeout: float) -> Tuple[bool, Optional[list]]:
+        deadline = time.monotonic() + timeout
+
+        try:
+            while time.monotonic() < deadline:
+                running, done, dataset = self.poll(key)
+
+                if done or not running:
+                    return done, dataset
+
+                time.sleep(POLL_INTERVAL)
+        except Exception as e:
+            logging.getLogger().exception("BduDwSingleFlight.wait exc=%s, key=%s", str(e), key)
+
+        return False, None
+
+    async def wait_async(self, key: str, timeout: float) -> Tuple[bool, Optional[list]]:
+        deadline = time.monotonic() + timeout
+
+        try:
+            while time.monotonic() < deadline:
+                running, done, dataset = self.poll(key)
+
+                if done or not running:
+                    return done, dataset
+
+                await asyncio.sleep(POLL_INTERVAL)
+        except Exception as e:
+            logging.getLogger().exception("BduDwSingleFlight.wait_async exc=%s, key=%s", str(e), key)
+
+        return False, None
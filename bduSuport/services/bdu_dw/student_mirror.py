@@ -0,0 +1,116 @@
+import logging
+from datetime import datetime
+from typing import Iterable, Optional
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max
+
+from bduSuport.models.bdu_student import BduStudent
+from bduSuport.services.bdu_dw.bdu_dw import BduDwService
+from bduSuport.services.bdu_dw.dto import BduStudentDto
+from bduSuport.services.bdu_dw.rate_limiter import PRIORITY_BATCH
+
+MIRRORED_FIELDS = [
+    "id_card", "date_of_birth", "full_name", "first_name", "last_name", "email", "gender", "ethnicity",
+    "religion", "attendance", "residence", "place_of_birth", "phone_number", "source", "academic_year",
+    "degree_name", "education_system_code", "faculty_code", "faculty_name", "field_code", "field_name",
+    "major_code", "major_name", "class_code", "class_name", "advisor_code", "advisor_name",
+]
+
+# watermark of a sync that committed part of the export and then failed, rows from the committed
+# batches may be newer than rows the export never reached
+PENDING_WATERMARK_KEY = "bdu_students:sync:pending_watermark"
+
+class BduStudentMirror:
+    def to_model(self, student: BduStudentDto) -> BduStudent:
+        return BduStudent(
+            student_id=int(student.student_id),
+            dw_created_at=student.created_at,
+            dw_updated_at=student.updated_at,
+            **{field: getattr(student, field) for field in MIRRORED_FIELDS}
+        )
+
+    def get_watermark(self) -> Optional[datetime]:
+        """
+        Newest dw_updated_at mirrored by sync(), rows stored by get_student() leave it empty so they never move it.
+        """
+        return BduStudent.objects.aggregate(watermark=Max("dw_updated_at"))["watermark"]
+
+    def upsert(self, students: Iterable[BduStudentDto], batch_size: int = 1000) -> int:
+        num_upserted = 0
+        # keyed by student_id, a row may not be upserted twice in one statement
+        batch = {}
+
+        for student in students:
+            model = self.to_model(student)
+            batch[model.student_id] = model
+
+            if len(batch) >= batch_size:
+                num_upserted = num_upserted + self.__commit(batch)
+                batch = {}
+
+        if batch:
+            num_upserted = num_upserted + self.__commit(batch)
+
+        return num_upserted
+
+    def sync(self) -> int:
+        """
+        Pulls the profiles updated since the newest one already mirrored (everything on the first run).
+        Each batch commits on its own so the export never holds a transaction open, a sync interrupted
+        midway keeps its starting watermark pending and the next run resumes from it.
+        """
+        # wrapped, a failed first run leaves an empty watermark pending that must still be told apart from no key
+        pending = cache.get(PENDING_WATERMARK_KEY)
+        watermark = pending["watermark"] if pending is not None else self.get_watermark()
+        cache.set(PENDING_WATERMARK_KEY, {"watermark": watermark}, timeout=None)
+
+        num_upserted = self.upsert(BduDwService(priority=PRIORITY_BATCH).iter_students(updated_since=watermark))
+        # every batch is in, the mirrored rows alone give the watermark again
+        cache.delete(PENDING_WATERMARK_KEY)
+
+        logging.getLogger().info("BduStudentMirror.sync watermark=%s, num_upserted=%s", watermark, num_upserted)
+
+        return num_upserted
+
+    def get_student(self, student_code) -> Optional[BduStudent]:
+        """
+        Reads the mirrored profile, a student missing from the mirror is looked up on the gateway once and stored.
+        """
+        try:
+            student_id = int(student_code)
+        except (TypeError, ValueError):
+            return None
+
+        student = BduStudent.objects.filter(student_id=student_id).first()
+
+        if student is not None:
+            return student
+
+        student_dto = BduDwService().get_student(student_code)
+
+        if student_dto is None:
+            return None
+
+        # not a synced row, its dw_updated_at would push the sync watermark past rows not mirrored yet
+        student = self.to_model(student_dto)
+        student.dw_updated_at = None
+        self.__flush({student.student_id: student}, update_fields=MIRRORED_FIELDS + ["dw_created_at", "synced_at"])
+
+        return BduStudent.objects.filter(student_id=student_id).first()
+
+    def __commit(self, batch: dict) -> int:
+        with transaction.atomic():
+            return self.__flush(batch)
+
+    def __flush(self, batch: dict, update_fields: Optional[list] = None) -> int:
+        # MySQL can not name the conflict target, its ON DUPLICATE KEY UPDATE matches the unique student_id anyway
+        unique_fields = ["student_id"] if connection.features.supports_update_conflicts_with_target else None
+        BduStudent.objects.bulk_create(
+            list(batch.values()),
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields or MIRRORED_FIELDS + ["dw_created_at", "dw_updated_at", "synced_at"],
+        )
+
+        return len(batch)
@@ -0,0 +1,91 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+from django_redis import get_redis_connection
+
+# the calls of a run are spread over every chunk and worker, they are gathered in Redis until the run is recorded
+CALLS_TTL = 24 * 3600
+# latencies kept per run, the oldest are dropped beyond it
+MAX_RECORDED_CALLS = 100000
+
+_recording_run_id: ContextVar[Optional[str]] = ContextVar("bdu_dw_recording_run_id", default=None)
+
+def get_percentile(values: List[float], percentile: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return None
+
+    rank = max(1, -(-len(values) * percentile // 100))
+
+    return values[int(rank) - 1]
+
+class BduDwCallRecorder():
+    """
+    Records the gateway calls made by BduDwService and AsyncBduDwService while a task run is recording:
+
+        with BduDwCallRecorder(run_id).recording():
+            ...
+
+    The latencies (milliseconds) go to the Redis list bdu_dw:calls:<run id>:latencies and the counters to
+    the hash bdu_dw:calls:<run id>, get_stats() summarizes them once the run is done.
+    """
+    def __init__(self, run_id: str):
+        self.__run_id = run_id
+
+    @contextmanager
+    def recording(self):
+        token = _recording_run_id.set(self.__run_id)
+
+        try:
+            yield self
+        finally:
+            _recording_run_id.reset(token)
+
+    def record(self, latency: float, failed: bool = False):
+        try:
+            latencies_key, counters_key = self.__make_key("latencies"), self.__make_key()
+            pipeline = get_redis_connection("default").pipeline()
+            pipeline.rpush(latencies_key, round(latency * 1000, 3)).ltrim(latencies_key, -MAX_RECORDED_CALLS, -1).expire(latencies_key, CALLS_TTL)
+            pipeline.hincrby(counters_key, "num_calls", 1).hincrby(counters_key, "num_errors", int(failed)).expire(counters_key, CALLS_TTL)
+            pipeline.execute()
+        except Exception as e:
+            logging.getLogger().exception("BduDwCallRecorder.record exc=%s, run_id=%s", str(e), self.__run_id)
+
+    def get_stats(self) -> dict:
+        stats = {"num_gateway_calls": 0, "num_gateway_errors": 0, "gateway_latency_p50": None, "gateway_latency_p95": None, "gateway_latency_p99": None}
+
+        try:
+            latencies, counters = get_redis_connection("default").pipeline().lrange(self.__make_key("latencies"), 0, -1).hgetall(self.__make_key()).execute()
+        except Exception as e:
+            logging.getLogger().exception("BduDwCallRecorder.get_stats exc=%s, run_id=%s", str(e), self.__run_id)
+            return stats
+
+        latencies = sorted(float(latency) for latency in latencies)
+        stats["num_gateway_calls"] = int(counters.get(b"num_calls", 0))
+        stats["num_gateway_errors"] = int(counters.get(b"num_errors", 0))
+
+        for percentile in [50, 95, 99]:
+            stats[f"gateway_latency_p{percentile}"] = get_percentile(latencies, percentile)
+
+        return stats
+
+    def clear(self):
+        try:
+            get_redis_connection("default").delete(self.__make_key("latencies"), self.__make_key())
+        except Exception as e:
+            logging.getLogger().exception("BduDwCallRecorder.clear exc=%s, run_id=%s", str(e), self.__run_id)
+
+    def __make_key(self, name: Optional[str] = None) -> str:
+        return f"bdu_dw:calls:{self.__run_id}" + (f":{name}" if name else "")
+
+def record_gateway_call(latency: float, failed: bool = False):
+    """
+    Called by the services after each gateway request, a no-op outside BduDwCallRecorder.recording().
+    """
+    run_id = _recording_run_id.get()
+
+    if run_id is not None:
+        BduDwCallRecorder(run_id).record(latency, failed)
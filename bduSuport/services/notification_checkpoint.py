@@ -0,0 +1,127 @@
+import logging
+import datetime
+from typing import Iterable, List, Optional, Set
+from django_redis import get_redis_connection
+
+# a run is resumed within the broker's visibility timeout, the progress hash stays a day to be looked at afterwards
+CHECKPOINT_TTL = 24 * 3600
+COUNTERS = ["num_chunks", "num_done_chunks", "num_processed", "num_notified", "num_inserted", "num_errors"]
+
+class NotificationCheckpointService():
+    """
+    Records the progress of one notification run in Redis so a chunk that is retried or redelivered after
+    its worker died resumes where it stopped instead of repeating the gateway work:
+
+        notification_checkpoint:<run id>:processed  set of the student codes already notified
+        notification_checkpoint:<run id>:cursors    hash first code of a chunk range -> last code processed in it
+        notification_checkpoint:<run id>:progress   hash of the run's status and counters (see get_progress)
+    """
+    def __init__(self, run_id: str):
+        self.__run_id = run_id
+
+    def start(self, task_name: str, num_chunks: int):
+        try:
+            key = self.__make_key("progress")
+            progress = {"task": task_name, "status": "running", "started_at": datetime.datetime.now().isoformat(), "num_chunks": num_chunks}
+            get_redis_connection("default").pipeline().hset(key, mapping=progress).expire(key, CHECKPOINT_TTL).set(make_latest_run_key(task_name), self.__run_id, ex=CHECKPOINT_TTL).execute()
+        except Exception as e:
+            logging.getLogger().exception("NotificationCheckpointService.start exc=%s, run_id=%s", str(e), self.__run_id)
+
+    def get_cursor(self, first_code: int) -> Optional[int]:
+        try:
+            cursor = get_redis_connection("default").hget(self.__make_key("cursors"), str(first_code))
+            return None if cursor is None else int(cursor)
+        except Exception as e:
+            logging.getLogger().exception("NotificationCheckpointService.get_cursor exc=%s, run_id=%s, first_code=%s", str(e), self.__run_id, first_code)
+            return None
+
+    def get_processed(self, student_codes: Iterable[int]) -> Set[int]:
+        student_codes = list(student_codes)
+
+        try:
+            pipeline = get_redis_connection("default").pipeline()
+
+            for student_code in student_codes:
+                pipeline.sismember(self.__make_key("processed"), str(student_code))
+
+            return {student_code for student_code, is_processed in zip(student_codes, pipeline.execute()) if is_processed}
+        except Exception as e:
+            logging.getLogger().exception("NotificationCheckpointService.get_processed exc=%s, run_id=%s", str(e), self.__run_id)
+            return set()
+
+    def commit(self, first_code: int, student_codes: List[int], num_notified: int = 0, num_inserted: int = 0, num_errors: int = 0):
+        """
+        Marks student_codes (in order, all from the chunk starting at first_code) as done, to be called once their
+        notifications are saved. A lost checkpoint only makes a resumed chunk redo the students, notifications are idempotent.
+        """
+        if not student_codes:
+            return
+
+        try:
+            processed_key, cursors_key, progress_key = self.__make_key("processed"), self.__make_key("cursors"), self.__make_key("progress")
+            pipeline = get_redis_connection("default").pipeline()
+            pipeline.sadd(processed_key, *[str(student_code) for student_code in student_codes]).expire(processed_key, CHECKPOINT_TTL)
+            pipeline.hset(cursors_key, str(first_code), str(student_codes[-1])).expire(cursors_key, CHECKPOINT_TTL)
+            pipeline.hincrby(progress_key, "num_processed", len(student_codes))
+            pipeline.hincrby(progress_key, "num_notified", num_notified)
+            pipeline.hincrby(progress_key, "num_inserted", num_inserted)
+            pipeline.hincrby(progress_key, "num_errors", num_errors)
+            pipeline.execute()
+        except Exception as e:
+            logging.getLogger().exception("NotificationCheckpointService.commit exc=%s, run_id=%s, first_code=%s", str(e), self.__run_id, first_code)
+
+    def finish_chunk(self):
+        try:
+            get_redis_connection("default").hincrby(self.__make_key("progress"), "num_done_chunks", 1)
+        except Exception as e:
+            logging.getLogger().exception("NotificationCheckpointService.finish_chunk exc=%s, run_id=%s", str(e), self.__run_id)
+
+    def finish(self, failed: bool = False) -> dict:
+        """
+        Closes the run and drops its resume state, returns the final progress.
+        """
+        try:
+            progress = {"status": "failed" if failed else "done", "finished_at": datetime.datetime.now().isoformat()}
+            get_redis_connection("default").pipeline().hset(self.__make_key("progress"), mapping=progress).delete(self.__make_key("processed"), self.__make_key("cursors")).execute()
+        except Exception as e:
+            logging.getLogger().exception("NotificationCheckpointService.finish exc=%s, run_id=%s", str(e), self.__run_id)
+
+        return self.get_progress()
+
+    def get_progress(self) -> dict:
+        try:
+            progress = {field.decode(): value.decode() for field, value in get_redis_connection("default").hgetall(self.__make_key("progress")).items()}
+        except Exception as e:
+            logging.getLogger().exception("NotificationCheckpointService.get_progress exc=%s, run_id=%s", str(e), self.__run_id)
+            return {}
+
+        for counter in COUNTERS:
+            if counter in progress:
+                progress[counter] = int(progress[counter])
+
+        return progress
+
+    def __make_key(self, name: str) -> str:
+        return f"notification_checkpoint:{self.__run_id}:{name}"
+
+def make_latest_run_key(task_name: str) -> str:
+    return f"notification_checkpoint:{task_name}:latest"
+
+def get_latest_progress(task_name: str) -> Optional[dict]:
+    """
+    Progress of the latest run of a notification task, while it runs or after, e.g.
+
+        get_latest_progress("send_student_attendance_notification")
+    """
+    try:
+        run_id = get_redis_connection("default").get(make_latest_run_key(task_name))
+    except Exception as e:
+        logging.getLogger().exception("get_latest_progress exc=%s, task_name=%s", str(e), task_name)
+        return None
+
+    if run_id is None:
+        return None
+
+    run_id = run_id.decode()
+
+    return {"run_id": run_id, **NotificationCheckpointService(run_id).get_progress()}
@@ -0,0 +1,71 @@
+import logging
+from django_redis import get_redis_connection
+
+from bduSuport.models.mini_app_user import MiniAppUser
+from bduSuport.models.student_supervision_registration import StudentSupervisionRegistration
+
+# an empty Redis set does not exist, this member marks a set that was built for a user without registrations
+BUILT_MARKER = "_"
+CODES_TTL = 3600
+
+# Writes the rebuilt set unless the user's registrations changed (generation bumped) since it was read from the database.
+REBUILD_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+
+redis.call('DEL', KEYS[1])
+redis.call('SADD', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+
+return 1
+"""
+
+class SupervisionAccessService():
+    """
+    Keeps the student codes each miniapp user supervises in a Redis set so the access check of
+    every supervision request is a single SISMEMBER. The set is rebuilt from the database on a miss
+    and dropped whenever the user's registrations change, which also bumps the user's generation so
+    a rebuild that read the registrations before the change does not write them back.
+    """
+    def can_access(self, user: MiniAppUser, student_code) -> bool:
+        try:
+            redis = get_redis_connection("default")
+            key = self.__make_key(user)
+            is_built, is_member = redis.pipeline().sismember(key, BUILT_MARKER).sismember(key, str(student_code)).execute()
+
+            if is_built:
+                return bool(is_member)
+
+            return str(student_code) in self.__rebuild(user)
+        except Exception as e:
+            logging.getLogger().exception("SupervisionAccessService.can_access exc=%s, user_id=%s, student_code=%s", str(e), user.id, student_code)
+
+        try:
+            return StudentSupervisionRegistration.objects.filter(deleted_at=None, miniapp_user=user, student_dw_code=int(student_code)).exists()
+        except (TypeError, ValueError):
+            return False
+
+    def invalidate(self, user: MiniAppUser):
+        try:
+            generation_key = self.__make_generation_key(user)
+            get_redis_connection("default").pipeline().incr(generation_key).expire(generation_key, CODES_TTL).delete(self.__make_key(user)).execute()
+        except Exception as e:
+            logging.getLogger().exception("SupervisionAccessService.invalidate exc=%s, user_id=%s", str(e), user.id)
+
+    def __rebuild(self, user: MiniAppUser) -> set:
+        redis = get_redis_connection("default")
+        generation = redis.get(self.__make_generation_key(user))
+        codes = {
+            str(code) for code in StudentSupervisionRegistration.objects.filter(deleted_at=None, miniapp_user=user).values_list("student_dw_code", flat=True)
+        }
+        script = redis.register_script(REBUILD_SCRIPT)
+        script(keys=[self.__make_key(user), self.__make_generation_key(user)], args=[generation.decode() if generation is not None else "", CODES_TTL, BUILT_MARKER, *codes])
+
+        return codes
+
+    def __make_key(self, user: MiniAppUser) -> str:
+        return f"student_supervision:codes:{user.id}"
+
+    def __make_generation_key(self, user: MiniAppUser) -> str:
+        return f"student_supervision:generation:{user.id}"
@@ -0,0 +1,26 @@
+import datetime
+import logging
+from celery import shared_task
+from bduSuport.services.bdu_dw.bdu_dw import BduDwService
+from bduSuport.services.bdu_dw.circuit_breaker import BduDwCircuitBreaker
+
+@shared_task
+def probe_bdu_dw_gateway():
+    healthy = False
+
+    try:
+        _start_time = datetime.datetime.now()
+        healthy = BduDwService().probe()
+        _end_time = datetime.datetime.now()
+
+        return {
+            "task": "probe_bdu_dw_gateway",
+            "start_time": _start_time,
+            "end_time": _end_time,
+            "healthy": healthy
+        }
+    except Exception as e:
+        logging.getLogger().exception("probe_bdu_dw_gateway exc=%s", str(e))
+        raise e
+    finally:
+        BduDwCircuitBreaker().probe_finished(healthy)
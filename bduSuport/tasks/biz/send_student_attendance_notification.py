@@ -1,65 +1,159 @@
 from datetime import date
 import logging
-from typing import List
-from bduSuport.models.mini_app_user import MiniAppUser
+from decouple import config
+from django.db import IntegrityError, transaction
+from typing import List, Optional, Tuple
 from bduSuport.services.bdu_dw.bdu_dw import BduDwService
+from bduSuport.services.bdu_dw.dto import Attendance
+from bduSuport.services.bdu_dw.rate_limiter import PRIORITY_BATCH
+from bduSuport.services.attendance_watermark import AttendanceWatermarkService, get_attendance_version
 from bduSuport.models.miniapp_notification import MiniappNotification
 
-def create_student_attendance_notification(student_dw_code: int, student_name: str, mini_app_users: List[MiniAppUser], attendance_date: date):
-    try:
-        attendances = BduDwService().get_attendances_by_student_code_and_date_range(student_dw_code, attendance_date, attendance_date)
-
-        for attendance in attendances:
-            _attendance_date = attendance.attendance_date.strftime("%d-%m-%Y")
-
-            for mini_app_user in mini_app_users:
-                try:
-                    MiniappNotification.objects.create(
-                        user=mini_app_user,
-                        content=f"Sinh viên {attendance.student_code} - {student_name} tham gia môn học {attendance.subject_code} - {attendance.subject_name} vào ngày {_attendance_date} (buổi: {attendance.lesson}) với trạng thái điểm danh: {attendance.status}"
-                    )
-                except Exception as e:
-                    logging.getLogger().exception(
-                        "create_student_attendance_notification create notification failed exc=%s, student_code=%s, student_name=%s, subject_code=%s, _attendance_date=%s, lesson=%s, status=%s",
-                        str(e),
-                        attendance.student_code,
-                        student_name,
-                        attendance.subject_code,
-                        _attendance_date,
-                        attendance.lesson,
-                        attendance.status
-                    )
+NOTIFICATION_BATCH_SIZE = config("NOTIFICATION_BATCH_SIZE", 500, cast=int)
+
+def filter_new_notifications(notifications: List[MiniappNotification]) -> List[MiniappNotification]:
+    """
+    Drops the notifications whose idempotency_key is already stored, or repeated within the list.
+    """
+    keys = [notification.idempotency_key for notification in notifications if notification.idempotency_key is not None]
+    seen = set(MiniappNotification.objects.filter(idempotency_key__in=keys).values_list("idempotency_key", flat=True)) if keys else set()
+    new_notifications = []
+
+    for notification in notifications:
+        if notification.idempotency_key is not None:
+            if notification.idempotency_key in seen:
+                continue
+
+            seen.add(notification.idempotency_key)
+
+        new_notifications.append(notification)
+
+    return new_notifications
+
+def save_notifications(notifications: List[MiniappNotification], batch_size: int = NOTIFICATION_BATCH_SIZE) -> Tuple[int, List[MiniappNotification]]:
+    """
+    Inserts the notifications with one bulk_create per batch_size rows. Rows whose idempotency_key is already stored
+    are skipped beforehand, so retried or overlapping runs never duplicate a notification, while any other error still
+    fails the insert (no INSERT IGNORE, which MySQL also applies to bad rows). A concurrent run can still store a key
+    between the check and the insert, a batch hitting the unique key is filtered again and inserted once more. A batch
+    that still fails is retried row by row so a bad row only loses itself, a row losing the race for its key counts
+    as a duplicate. Returns how many notifications were actually inserted and the notifications that could not be written.
+    """
+    num_inserted = 0
+    failed = []
+
+    for i in range(0, len(notifications), batch_size):
+        batch = filter_new_notifications(notifications[i:i + batch_size])
+
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    MiniappNotification.objects.bulk_create(batch)
+
+                num_inserted = num_inserted + len(batch)
+                batch = []
+                break
+            except IntegrityError as e:
+                if attempt == 0:
+                    logging.getLogger().warning("save_notifications batch lost a key to a concurrent run, filtering again exc=%s, batch_size=%s", str(e), len(batch))
+                    batch = filter_new_notifications(batch)
+                    continue
+
+                logging.getLogger().exception("save_notifications batch failed, saving row by row exc=%s, batch_size=%s", str(e), len(batch))
+            except Exception as e:
+                logging.getLogger().exception("save_notifications batch failed, saving row by row exc=%s, batch_size=%s", str(e), len(batch))
+                break
+
+        for notification in batch:
+            try:
+                with transaction.atomic():
+                    notification.save()
+
+                num_inserted = num_inserted + 1
+            except Exception as e:
+                if isinstance(e, IntegrityError) and notification.idempotency_key is not None and MiniappNotification.objects.filter(idempotency_key=notification.idempotency_key).exists():
                     continue
+
+                logging.getLogger().exception("save_notifications create notification failed exc=%s, user_id=%s, content=%s", str(e), notification.user_id, notification.content)
+                failed.append(notification)
+
+    return num_inserted, failed
+
+def make_attendance_notification_key(attendance: Attendance, mini_app_user_id: int) -> str:
+    return f"attendance:{attendance.attendance_id}:{get_attendance_version(attendance)}:{mini_app_user_id}"
+
+def get_notified_attendances(attendances: List[Attendance], mini_app_user_ids: List[int], failed: List[MiniappNotification]) -> List[Attendance]:
+    """
+    The attendances whose notifications were all written, only those may be committed to the watermark
+    so a notification that failed is tried again by the next run.
+    """
+    failed_keys = {notification.idempotency_key for notification in failed}
+
+    return [
+        attendance for attendance in attendances
+        if not any(make_attendance_notification_key(attendance, mini_app_user_id) in failed_keys for mini_app_user_id in mini_app_user_ids)
+    ]
+
+def build_student_attendance_notifications(student_dw_code: int, student_name: str, mini_app_user_ids: List[int], attendance_date: date, attendances: Optional[List[Attendance]] = None) -> Tuple[List[MiniappNotification], List[Attendance]]:
+    """
+    Notifications (unsaved) for the rows that are new or changed since the previous run, returned
+    with those rows so the caller commits them to the watermark once the notifications are saved.
+    """
+    if attendances is None:
+        attendances = BduDwService(use_cache=False, priority=PRIORITY_BATCH).get_attendances_by_student_code_and_date_range(student_dw_code, attendance_date, attendance_date)
+
+    attendances = AttendanceWatermarkService().get_changed(student_dw_code, attendance_date, attendances)
+    notifications = []
+
+    for attendance in attendances:
+        _attendance_date = attendance.attendance_date.strftime("%d-%m-%Y")
+
+        for mini_app_user_id in mini_app_user_ids:
+            notifications.append(MiniappNotification(
+                user_id=mini_app_user_id,
+                idempotency_key=make_attendance_notification_key(attendance, mini_app_user_id),
+                content=f"Sinh viên {attendance.student_code} - {student_name} tham gia môn học {attendance.subject_code} - {attendance.subject_name} vào ngày {_attendance_date} (buổi: {attendance.lesson}) với trạng thái điểm danh: {attendance.status}"
+            ))
+
+    return notifications, attendances
+
+def create_student_attendance_notification(student_dw_code: int, student_name: str, mini_app_user_ids: List[int], attendance_date: date, attendances: Optional[List[Attendance]] = None) -> int:
+    """
+    Notifies the rows that are new or changed since the previous run only, returns how many rows were notified.
+    """
+    try:
+        notifications, attendances = build_student_attendance_notifications(student_dw_code, student_name, mini_app_user_ids, attendance_date, attendances)
+        _, failed = save_notifications(notifications)
+        attendances = get_notified_attendances(attendances, mini_app_user_ids, failed)
+        AttendanceWatermarkService().commit(student_dw_code, attendance_date, attendances)
+
+        return len(attendances)
     except Exception as e:
         logging.getLogger().exception(
-            "create_student_attendance_notification exc=%s, student_dw_code=%s, mini_app_user_ids=%s", 
-            str(e), student_dw_code, [user.id for user in mini_app_users]
+            "create_student_attendance_notification exc=%s, student_dw_code=%s, mini_app_user_ids=%s",
+            str(e), student_dw_code, mini_app_user_ids
         )
+        return 0
+
+def build_student_academic_classification_notifications(student_dw_code: int, mini_app_user_ids: List[int], date: date) -> List[MiniappNotification]:
+    classifications = BduDwService(use_cache=False, priority=PRIORITY_BATCH).get_student_academic_classifications(student_dw_code, date)
+    notifications = []
 
-def create_student_academic_classification_notification(student_dw_code: int, mini_app_users: List[MiniAppUser], date: date):
+    for classification in classifications:
+        for mini_app_user_id in mini_app_user_ids:
+            notifications.append(MiniappNotification(
+                user_id=mini_app_user_id,
+                idempotency_key=f"classification:{classification.student_id}:{classification.semester_code}:{classification.classification}:{mini_app_user_id}",
+                content=f"Kết quả học tập của sinh viên {classification.student_id} - {classification.full_name} trong học kỳ {classification.semester} năm {classification.academic_year} là: {classification.classification}"
+            ))
+
+    return notifications
+
+def create_student_academic_classification_notification(student_dw_code: int, mini_app_user_ids: List[int], date: date):
     try:
-        classifications = BduDwService().get_student_academic_classifications(student_dw_code, date)
-
-        for classification in classifications:
-            for mini_app_user in mini_app_users:
-                try:
-                    MiniappNotification.objects.create(
-                        user=mini_app_user,
-                        content=f"Kết quả học tập của sinh viên {classification.student_id} - {classification.full_name} trong học kỳ {classification.semester} năm {classification.academic_year} là: {classification.classification}"
-                    )
-                except Exception as e:
-                    logging.getLogger().exception(
-                        "create_student_academic_classification_notification create notification failed exc=%s, student_code=%s, student_name=%s, classification=%s, semester=%s, academic_year=%s",
-                        str(e),
-                        classification.student_id,
-                        classification.full_name,
-                        classification.classification,
-                        classification.semester,
-                        classification.academic_year
-                    )
-                    continue
+        save_notifications(build_student_academic_classification_notifications(student_dw_code, mini_app_user_ids, date))
     except Exception as e:
         logging.getLogger().exception(
-            "create_student_academic_classification_notification exc=%s, student_dw_code=%s, mini_app_user_ids=%s", 
-            str(e), student_dw_code, [user.id for user in mini_app_users]
+            "create_student_academic_classification_notification exc=%s, student_dw_code=%s, mini_app_user_ids=%s",
+            str(e), student_dw_code, mini_app_user_ids
         )
@@ -0,0 +1,64 @@
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterable, Iterator, List, Optional, Tuple
+from bduSuport.models.student_supervision_registration import StudentSupervisionRegistration
+
+# rows read per query or database cursor round trip
+SCAN_CHUNK_SIZE = 2000
+
+def get_student_code_ranges(num_students: int) -> List[Tuple[int, int]]:
+    """
+    Cuts the distinct supervised student codes, read in order by pages of SCAN_CHUNK_SIZE codes (keyset on the
+    code, the MySQL driver buffers a whole result set even under .iterator()), into [first, last] ranges of
+    num_students codes each. Only the range bounds are kept, so memory does not grow with the population.
+    """
+    ranges = []
+    first_code = last_code = None
+    count = 0
+    queryset = StudentSupervisionRegistration.objects.filter(deleted_at=None).order_by("student_dw_code").values_list("student_dw_code", flat=True).distinct()
+
+    while True:
+        codes = list((queryset if last_code is None else queryset.filter(student_dw_code__gt=last_code))[:SCAN_CHUNK_SIZE])
+
+        for student_dw_code in codes:
+            if count == 0:
+                first_code = student_dw_code
+
+            last_code = student_dw_code
+            count = count + 1
+
+            if count == num_students:
+                ranges.append((first_code, last_code))
+                count = 0
+
+        if len(codes) < SCAN_CHUNK_SIZE:
+            break
+
+    if count:
+        ranges.append((first_code, last_code))
+
+    return ranges
+
+def iter_supervised_students(first_code: Optional[int] = None, last_code: Optional[int] = None, student_codes: Optional[Iterable[int]] = None) -> Iterator[list]:
+    """
+    Streams [student_dw_code, student_full_name, [miniapp_user_id, ...]] of the students with active registrations
+    (optionally within [first_code, last_code] or among student_codes) from a single query ordered by student code,
+    rows of a student are adjacent so they are grouped on the fly. The MySQL driver still buffers the result set,
+    callers bound it to a chunk range or a slot's student codes.
+    """
+    queryset = StudentSupervisionRegistration.objects.filter(deleted_at=None)
+
+    if student_codes is not None:
+        queryset = queryset.filter(student_dw_code__in=list(student_codes))
+
+    if first_code is not None:
+        queryset = queryset.filter(student_dw_code__gte=first_code)
+
+    if last_code is not None:
+        queryset = queryset.filter(student_dw_code__lte=last_code)
+
+    rows = queryset.order_by("student_dw_code", "id").values_list("student_dw_code", "student_full_name", "miniapp_user_id").iterator(chunk_size=SCAN_CHUNK_SIZE)
+
+    for student_dw_code, student_rows in groupby(rows, key=itemgetter(0)):
+        student_rows = list(student_rows)
+        yield [student_dw_code, student_rows[-1][1], [miniapp_user_id for _, _, miniapp_user_id in student_rows]]
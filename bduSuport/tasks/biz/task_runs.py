@@ -0,0 +1,32 @@
+import datetime
+import logging
+from bduSuport.models.task_run import TaskRun
+from bduSuport.services.bdu_dw.telemetry import BduDwCallRecorder
+
+def make_run_id(task_name: str, start_time: datetime.datetime) -> str:
+    return f"{task_name}:{start_time.isoformat()}"
+
+def save_task_run(task_name: str, run_id: str, start_time: datetime.datetime, end_time: datetime.datetime, failed: bool = False, num_students: int = 0, num_notifications: int = 0, num_errors: int = 0):
+    """
+    Stores the run with the gateway calls recorded under run_id (see BduDwCallRecorder), never raises so
+    the telemetry can not fail a task. A finalizer that runs twice updates the same row.
+    """
+    try:
+        recorder = BduDwCallRecorder(run_id)
+        TaskRun.objects.update_or_create(
+            run_id=run_id,
+            defaults={
+                "task": task_name,
+                "failed": failed,
+                "started_at": start_time,
+                "finished_at": end_time,
+                "duration": (end_time - start_time).total_seconds(),
+                "num_students": num_students,
+                "num_notifications": num_notifications,
+                "num_errors": num_errors,
+                **recorder.get_stats()
+            }
+        )
+        recorder.clear()
+    except Exception as e:
+        logging.getLogger().exception("save_task_run exc=%s, run_id=%s", str(e), run_id)
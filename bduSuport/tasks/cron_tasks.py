@@ -1,79 +1,446 @@
+import time
 import datetime
 import logging
-from collections import defaultdict
-from celery import shared_task
+from typing import Iterator, Tuple
+from decouple import config
+from celery import chord, current_app, shared_task
+from celery.exceptions import Retry
+from celery.utils.time import make_aware
+from bduSuport.errors.bdu_dw_unavailable_exception import BduDwUnavailableException
 from bduSuport.models.student_supervision_registration import StudentSupervisionRegistration
-from bduSuport.tasks.biz.send_student_attendance_notification import create_student_attendance_notification, create_student_academic_classification_notification
+from bduSuport.services.bdu_dw.async_bdu_dw import run_with_async_service
+from bduSuport.services.bdu_dw.bdu_dw import BduDwService
+from bduSuport.services.bdu_dw.cache import BduDwCache
+from bduSuport.services.bdu_dw.rate_limiter import PRIORITY_BATCH
+from bduSuport.services.bdu_dw.queries import ATTENDANCE_CHUNK_DAYS, split_date_range, attendances_query, daily_attendances_query, time_tables_query, academic_classifications_query
+from bduSuport.services.bdu_dw.student_mirror import BduStudentMirror
+from bduSuport.services.bdu_dw.telemetry import BduDwCallRecorder
+from bduSuport.services.attendance_schedule import AttendanceScheduleService, group_students_by_last_lesson
+from bduSuport.services.attendance_watermark import AttendanceWatermarkService
+from bduSuport.services.notification_checkpoint import NotificationCheckpointService
+from bduSuport.tasks.biz.task_runs import make_run_id, save_task_run
+from bduSuport.tasks.biz.supervised_students import get_student_code_ranges, iter_supervised_students
+from bduSuport.tasks.biz.send_student_attendance_notification import build_student_attendance_notifications, build_student_academic_classification_notifications, save_notifications, get_notified_attendances
 from bduSuport.tasks.heartbeats import send_heartbeat
 
+NOTIFICATION_CHUNK_SIZE = config("NOTIFICATION_CHUNK_SIZE", 200, cast=int)
+# students notified between two checkpoints of a chunk
+NOTIFICATION_CHECKPOINT_SIZE = config("NOTIFICATION_CHECKPOINT_SIZE", 50, cast=int)
+# a chunk running longer than this retries itself from its last checkpoint, well before CELERY_TASK_TIME_LIMIT kills it
+NOTIFICATION_CHUNK_TIME_BUDGET = config("NOTIFICATION_CHUNK_TIME_BUDGET", 20 * 60, cast=int)
+NOTIFICATION_CHUNK_MAX_RETRIES = config("NOTIFICATION_CHUNK_MAX_RETRIES", 10, cast=int)
+# minutes after the end of a student's last lesson their attendances are checked, lecturers mark them during the lesson
+ATTENDANCE_NOTIFICATION_DELAY = config("ATTENDANCE_NOTIFICATION_DELAY", 15, cast=int)
+# minutes between two runs of schedule_student_attendance_notifications, keep it in line with the beat schedule
+ATTENDANCE_SCHEDULE_WINDOW = config("ATTENDANCE_SCHEDULE_WINDOW", 30, cast=int)
+
+def dispatch_notification_chunks(task_name: str, heartbeat_id: str, chunk_task, *args) -> int:
+    """
+    Runs chunk_task(run_id, student_code_range, *args) on ranges of NOTIFICATION_CHUNK_SIZE students as a chord over every
+    worker, each chunk scans its own range. finalize_student_notification sums the chunk results and sends the heartbeat.
+    The run's progress can be read with get_latest_progress(task_name) while it executes.
+    """
+    _start_time = datetime.datetime.now()
+    run_id = make_run_id(task_name, _start_time)
+    student_code_ranges = get_student_code_ranges(NOTIFICATION_CHUNK_SIZE)
+    finalizer = finalize_student_notification.s(task_name, heartbeat_id, _start_time.isoformat(), run_id)
+    NotificationCheckpointService(run_id).start(task_name, len(student_code_ranges))
+
+    if not student_code_ranges:
+        finalizer.delay([])
+        return 0
+
+    chord(chunk_task.s(run_id, student_code_range, *args) for student_code_range in student_code_ranges)(finalizer)
+
+    return len(student_code_ranges)
+
+def get_pending_students(checkpoint: NotificationCheckpointService, student_code_range: list) -> list:
+    """
+    The students of the range a previous attempt of the chunk has not notified yet.
+    """
+    first_code, last_code = student_code_range
+    cursor = checkpoint.get_cursor(first_code)
+    students = list(iter_supervised_students(first_code if cursor is None else cursor + 1, last_code))
+    processed = checkpoint.get_processed(student_dw_code for student_dw_code, _, _ in students)
+
+    return [student for student in students if student[0] not in processed]
+
+def iter_checkpoint_batches(task, students: list, deadline: float) -> Iterator[list]:
+    """
+    Yields the students NOTIFICATION_CHECKPOINT_SIZE at a time, the caller checkpoints a batch before asking
+    for the next one. Once the time budget is spent the task is retried and resumes after that checkpoint.
+    """
+    for i in range(0, len(students), NOTIFICATION_CHECKPOINT_SIZE):
+        if i and time.monotonic() > deadline:
+            logging.getLogger().warning("%s time budget spent, retrying from checkpoint num_pending=%s", task.name, len(students) - i)
+            raise task.retry(countdown=0)
+
+        yield students[i:i + NOTIFICATION_CHECKPOINT_SIZE]
+
+def get_daily_attendances(attendance_date: datetime.date, student_codes: list, use_cache: bool = True) -> dict:
+    """
+    The day's attendances of the students from the single bulk call, per student requests if it fails.
+    """
+    attendances = BduDwService(use_cache=use_cache, priority=PRIORITY_BATCH).get_attendances_by_date(attendance_date, student_codes)
+
+    if attendances is None:
+        logging.getLogger().error("get_daily_attendances bulk attendance fetch failed, falling back to per student requests")
+        attendances = run_with_async_service(
+            lambda service: service.get_attendances_for_students(student_codes, attendance_date, attendance_date),
+            use_cache=False,
+            priority=PRIORITY_BATCH
+        )
+
+    return attendances
+
+def notify_student_attendances(students: list, attendance_date: datetime.date, attendances: dict) -> Tuple[int, int, int]:
+    """
+    Notifies the new or changed attendances of the students and commits to the watermark the ones whose notifications
+    were all written, returns the number of attendances notified, notifications inserted and students that failed.
+    """
+    notifications = []
+    notified_attendances = {}
+    num_notified = 0
+    num_errors = 0
+
+    for student_dw_code, student_full_name, user_ids in students:
+        try:
+            student_notifications, student_attendances = build_student_attendance_notifications(student_dw_code, student_full_name, user_ids, attendance_date, attendances.get(student_dw_code, []))
+            notifications.extend(student_notifications)
+            notified_attendances[student_dw_code] = (user_ids, student_attendances)
+        except Exception as e:
+            logging.getLogger().exception("notify_student_attendances exc=%s, student_dw_code=%s", str(e), student_dw_code)
+            num_errors = num_errors + 1
+            continue
+
+    num_inserted, failed = save_notifications(notifications)
+    watermark = AttendanceWatermarkService()
+
+    for student_dw_code, (user_ids, student_attendances) in notified_attendances.items():
+        written_attendances = get_notified_attendances(student_attendances, user_ids, failed)
+        watermark.commit(student_dw_code, attendance_date, written_attendances)
+        num_notified = num_notified + len(written_attendances)
+
+        if len(written_attendances) < len(student_attendances):
+            num_errors = num_errors + 1
+
+    return num_notified, num_inserted, num_errors
+
 @shared_task
-def send_student_attendance_notification():
-    try:
-        _start_time = datetime.datetime.now()
-        queryset = StudentSupervisionRegistration.objects.filter(deleted_at=None)
-        grouped_users = defaultdict(list)
-        student_infos = {}
-        num_errors = 0
+def finalize_student_notification(results: list, task_name: str, heartbeat_id: str, start_time: str, run_id: str):
+    num_failed_chunks = sum(1 for result in results if result["failed"])
+    # the checkpoint counts the students of every attempt of a chunk, a result only those of the last one
+    progress = NotificationCheckpointService(run_id).finish(num_failed_chunks > 0)
+    _end_time = datetime.datetime.now()
+    send_heartbeat(heartbeat_id, num_failed_chunks > 0)
+    summary = {
+        "task": task_name,
+        "run_id": run_id,
+        "start_time": start_time,
+        "end_time": _end_time,
+        "num_chunks": len(results),
+        "num_failed_chunks": num_failed_chunks,
+        "num_students": progress.get("num_processed", sum(result["num_students"] for result in results)),
+        "num_notified": progress.get("num_notified", sum(result.get("num_notified", 0) for result in results)),
+        "num_inserted": progress.get("num_inserted", sum(result.get("num_inserted", 0) for result in results)),
+        "num_errors": progress.get("num_errors", 0) + sum(result["num_errors"] for result in results if result["failed"])
+    }
+    save_task_run(
+        task_name,
+        run_id,
+        datetime.datetime.fromisoformat(start_time),
+        _end_time,
+        failed=num_failed_chunks > 0,
+        num_students=summary["num_students"],
+        # rows inserted, keys already stored by a retried or overlapping run are not counted
+        num_notifications=summary["num_inserted"],
+        num_errors=summary["num_errors"]
+    )
 
-        for obj in queryset:
-            grouped_users[obj.student_dw_code].append(obj.miniapp_user)
-            student_infos[obj.student_dw_code] = obj.student_full_name
+    return summary
 
+@shared_task
+def send_student_attendance_notification():
+    try:
         today = datetime.datetime.now().date()
-        
-        for student_code, users in grouped_users.items():
-            try:
-                create_student_attendance_notification(student_code, student_infos[student_code], users, today)
-            except:
-                num_errors = num_errors + 1
-                continue
+        # every chunk reads the day's attendances through the cache, drop the copy of a previous run first
+        query = daily_attendances_query(today, today)
+        BduDwCache().invalidate_query(query.endpoint, query.params)
+        num_chunks = dispatch_notification_chunks("send_student_attendance_notification", "DZGSQi8BBK5yFjQfFzzd8yvi", send_student_attendance_notification_chunk, today.isoformat())
 
-        _end_time = datetime.datetime.now()
-        send_heartbeat("DZGSQi8BBK5yFjQfFzzd8yvi")
-        
         return {
             "task": "send_student_attendance_notification",
-            "start_time": _start_time,
-            "end_time": _end_time,
-            "num_errors": num_errors
+            "num_chunks": num_chunks
         }
     except Exception as e:
         logging.getLogger().exception("send_student_attendance_notification exc=%s", str(e))
         send_heartbeat("DZGSQi8BBK5yFjQfFzzd8yvi", True)
         raise e
 
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=NOTIFICATION_CHUNK_MAX_RETRIES)
+def send_student_attendance_notification_chunk(self, run_id: str, student_code_range: list, attendance_date: str):
+    """
+    Never raises but to retry itself, a failed chunk is reported in its result so the chord finalizer still runs.
+    Progress is checkpointed every NOTIFICATION_CHECKPOINT_SIZE students, a chunk redelivered after its worker died
+    or retried once its time budget is spent only handles the students left.
+    """
+    deadline = time.monotonic() + NOTIFICATION_CHUNK_TIME_BUDGET
+    checkpoint = NotificationCheckpointService(run_id)
+    num_notified = 0
+    num_inserted = 0
+    num_errors = 0
+    students = []
+
+    with BduDwCallRecorder(run_id).recording():
+        try:
+            students = get_pending_students(checkpoint, student_code_range)
+            attendance_date = datetime.date.fromisoformat(attendance_date)
+            # the first chunk fetches the whole day, the others are served by the cache or join its flight
+            attendances = get_daily_attendances(attendance_date, [student_dw_code for student_dw_code, _, _ in students])
+
+            for batch in iter_checkpoint_batches(self, students, deadline):
+                batch_notified, batch_inserted, batch_errors = notify_student_attendances(batch, attendance_date, attendances)
+                checkpoint.commit(student_code_range[0], [student_dw_code for student_dw_code, _, _ in batch], batch_notified, batch_inserted, batch_errors)
+                num_notified = num_notified + batch_notified
+                num_inserted = num_inserted + batch_inserted
+                num_errors = num_errors + batch_errors
+
+            checkpoint.finish_chunk()
+
+            return {"failed": False, "num_students": len(students), "num_notified": num_notified, "num_inserted": num_inserted, "num_errors": num_errors}
+        except Retry:
+            raise
+        except Exception as e:
+            logging.getLogger().exception("send_student_attendance_notification_chunk exc=%s, num_students=%s", str(e), len(students))
+            return {"failed": True, "num_students": len(students), "num_notified": num_notified, "num_errors": len(students)}
+
 @shared_task
-def send_student_academic_classification_notification():
+def schedule_student_attendance_notifications():
+    """
+    Runs every ATTENDANCE_SCHEDULE_WINDOW minutes through the school day. Its first run of the day reads the time table
+    of every supervised student and groups the students by the end of their last lesson (AttendanceScheduleService),
+    then each run enqueues the slots coming due within the window as send_student_attendance_notification_slot with an
+    ETA ATTENDANCE_NOTIFICATION_DELAY minutes after the lesson. The ETA stays shorter than the broker visibility timeout.
+    The nightly send_student_attendance_notification sweep still catches later changes and students without a time table.
+    """
+    _start_time = datetime.datetime.now()
+    run_id = make_run_id("schedule_student_attendance_notifications", _start_time)
+
     try:
-        _start_time = datetime.datetime.now()
-        queryset = StudentSupervisionRegistration.objects.filter(deleted_at=None)
-        grouped_users = defaultdict(list)
-        student_infos = {}
+        # lesson times are local to the school, as is the beat schedule
+        now = datetime.datetime.now(current_app.timezone)
+        today = now.date()
+        schedule = AttendanceScheduleService()
+        delay = datetime.timedelta(minutes=ATTENDANCE_NOTIFICATION_DELAY)
+        num_students = 0
+        num_tasks = 0
         num_errors = 0
 
-        for obj in queryset:
-            grouped_users[obj.student_dw_code].append(obj.miniapp_user)
-            student_infos[obj.student_dw_code] = obj.student_full_name
+        with BduDwCallRecorder(run_id).recording():
+            # a run overlapping a slow build leaves it to its builder and only hands out what is already saved
+            if not schedule.is_built(today) and schedule.acquire_build(today):
+                try:
+                    slots = {}
 
-        today = datetime.datetime.now().date()
+                    for first_code, last_code in get_student_code_ranges(NOTIFICATION_CHUNK_SIZE):
+                        student_codes = [student_dw_code for student_dw_code, _, _ in iter_supervised_students(first_code, last_code)]
+                        # strict, a time table that could not be fetched must not pass for a day without lessons
+                        time_tables = run_with_async_service(lambda service: service.get_time_tables_for_students(student_codes, today), strict=True, priority=PRIORITY_BATCH)
+
+                        for end_time, slot_student_codes in group_students_by_last_lesson(time_tables).items():
+                            slots.setdefault(end_time, []).extend(slot_student_codes)
+
+                    if schedule.save(today, slots):
+                        num_students = sum(len(slot_student_codes) for slot_student_codes in slots.values())
+                except BduDwUnavailableException as e:
+                    # nothing is saved so the next run builds the day again, the time tables fetched so far come from the cache
+                    logging.getLogger().warning("schedule_student_attendance_notifications schedule not built exc=%s, date=%s", str(e), today)
+                    num_errors = num_errors + 1
+                finally:
+                    schedule.release_build(today)
+
+        # slots whose ETA falls before the next run
+        until = (now + datetime.timedelta(minutes=ATTENDANCE_SCHEDULE_WINDOW) - delay).time()
 
-        for student_code, users in grouped_users.items():
-            try:
-                create_student_academic_classification_notification(student_code, users, today)
-            except:
-                num_errors = num_errors + 1
-                continue
+        for end_time, student_codes in sorted(schedule.pop_due(today, until).items()):
+            eta = make_aware(datetime.datetime.combine(today, end_time) + delay, current_app.timezone)
+
+            for i in range(0, len(student_codes), NOTIFICATION_CHUNK_SIZE):
+                send_student_attendance_notification_slot.apply_async(args=(student_codes[i:i + NOTIFICATION_CHUNK_SIZE], today.isoformat()), eta=eta)
+                num_tasks = num_tasks + 1
 
         _end_time = datetime.datetime.now()
-        send_heartbeat("WtPDFH9aCpZscKY7xhYPWWsw")
-        
+        save_task_run("schedule_student_attendance_notifications", run_id, _start_time, _end_time, failed=num_errors > 0, num_students=num_students, num_errors=num_errors)
+
         return {
-            "task": "send_student_academic_classification_notification",
+            "task": "schedule_student_attendance_notifications",
             "start_time": _start_time,
             "end_time": _end_time,
+            "num_students": num_students,
+            "num_tasks": num_tasks,
             "num_errors": num_errors
         }
+    except Exception as e:
+        logging.getLogger().exception("schedule_student_attendance_notifications exc=%s", str(e))
+        save_task_run("schedule_student_attendance_notifications", run_id, _start_time, datetime.datetime.now(), failed=True, num_errors=1)
+        raise e
+
+@shared_task
+def send_student_attendance_notification_slot(student_codes: list, attendance_date: str):
+    """
+    Attendance check of students whose last lesson just ended, the day's attendances are read live (concurrent slot
+    tasks share one gateway call through the single flight) so lessons marked in the meantime are not missed.
+    """
+    _start_time = datetime.datetime.now()
+    run_id = make_run_id(f"send_student_attendance_notification_slot:{student_codes[0] if student_codes else ''}", _start_time)
+
+    try:
+        with BduDwCallRecorder(run_id).recording():
+            attendance_date = datetime.date.fromisoformat(attendance_date)
+            students = list(iter_supervised_students(student_codes=student_codes))
+            attendances = get_daily_attendances(attendance_date, [student_dw_code for student_dw_code, _, _ in students], use_cache=False)
+            num_notified, num_inserted, num_errors = notify_student_attendances(students, attendance_date, attendances)
+
+        _end_time = datetime.datetime.now()
+        save_task_run("send_student_attendance_notification_slot", run_id, _start_time, _end_time, failed=num_errors > 0, num_students=len(students), num_notifications=num_inserted, num_errors=num_errors)
+
+        return {
+            "task": "send_student_attendance_notification_slot",
+            "start_time": _start_time,
+            "end_time": _end_time,
+            "num_students": len(students),
+            "num_notified": num_notified,
+            "num_inserted": num_inserted,
+            "num_errors": num_errors
+        }
+    except Exception as e:
+        logging.getLogger().exception("send_student_attendance_notification_slot exc=%s, student_codes=%s", str(e), student_codes)
+        save_task_run("send_student_attendance_notification_slot", run_id, _start_time, datetime.datetime.now(), failed=True, num_errors=len(student_codes))
+        raise e
+
+@shared_task
+def send_student_academic_classification_notification():
+    try:
+        today = datetime.datetime.now().date()
+        num_chunks = dispatch_notification_chunks("send_student_academic_classification_notification", "WtPDFH9aCpZscKY7xhYPWWsw", send_student_academic_classification_notification_chunk, today.isoformat())
+
+        return {
+            "task": "send_student_academic_classification_notification",
+            "num_chunks": num_chunks
+        }
     except Exception as e:
         logging.getLogger().exception("send_student_academic_classification_notification exc=%s", str(e))
         send_heartbeat("WtPDFH9aCpZscKY7xhYPWWsw", True)
         raise e
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=NOTIFICATION_CHUNK_MAX_RETRIES)
+def send_student_academic_classification_notification_chunk(self, run_id: str, student_code_range: list, date: str):
+    """
+    Never raises but to retry itself, checkpointed like send_student_attendance_notification_chunk.
+    """
+    deadline = time.monotonic() + NOTIFICATION_CHUNK_TIME_BUDGET
+    checkpoint = NotificationCheckpointService(run_id)
+    num_inserted = 0
+    num_errors = 0
+    students = []
+
+    with BduDwCallRecorder(run_id).recording():
+        try:
+            students = get_pending_students(checkpoint, student_code_range)
+            date = datetime.date.fromisoformat(date)
+
+            for batch in iter_checkpoint_batches(self, students, deadline):
+                notifications = []
+                batch_errors = 0
+
+                for student_dw_code, _, user_ids in batch:
+                    try:
+                        notifications.extend(build_student_academic_classification_notifications(student_dw_code, user_ids, date))
+                    except Exception as e:
+                        logging.getLogger().exception("send_student_academic_classification_notification_chunk exc=%s, student_dw_code=%s", str(e), student_dw_code)
+                        batch_errors = batch_errors + 1
+                        continue
+
+                batch_inserted, failed = save_notifications(notifications)
+                batch_errors = batch_errors + len(failed)
+                checkpoint.commit(student_code_range[0], [student_dw_code for student_dw_code, _, _ in batch], num_inserted=batch_inserted, num_errors=batch_errors)
+                num_inserted = num_inserted + batch_inserted
+                num_errors = num_errors + batch_errors
+
+            checkpoint.finish_chunk()
+
+            return {"failed": False, "num_students": len(students), "num_inserted": num_inserted, "num_errors": num_errors}
+        except Retry:
+            raise
+        except Exception as e:
+            logging.getLogger().exception("send_student_academic_classification_notification_chunk exc=%s, num_students=%s", str(e), len(students))
+            return {"failed": True, "num_students": len(students), "num_errors": len(students)}
+
+@shared_task
+def sync_bdu_students():
+    _start_time = datetime.datetime.now()
+    run_id = make_run_id("sync_bdu_students", _start_time)
+
+    try:
+        with BduDwCallRecorder(run_id).recording():
+            num_upserted = BduStudentMirror().sync()
+
+        _end_time = datetime.datetime.now()
+        save_task_run("sync_bdu_students", run_id, _start_time, _end_time, num_students=num_upserted)
+
+        return {
+            "task": "sync_bdu_students",
+            "start_time": _start_time,
+            "end_time": _end_time,
+            "num_upserted": num_upserted
+        }
+    except Exception as e:
+        logging.getLogger().exception("sync_bdu_students exc=%s", str(e))
+        save_task_run("sync_bdu_students", run_id, _start_time, datetime.datetime.now(), failed=True, num_errors=1)
+        raise e
+
+@shared_task
+def prewarm_bdu_dw_cache():
+    _start_time = datetime.datetime.now()
+    run_id = make_run_id("prewarm_bdu_dw_cache", _start_time)
+
+    try:
+        student_codes = list(StudentSupervisionRegistration.objects.filter(deleted_at=None).values_list("student_dw_code", flat=True).distinct())
+        # the servers run in UTC, the day to warm is the school's as in schedule_student_attendance_notifications
+        today = datetime.datetime.now(current_app.timezone).date()
+        # the attendance chunk holding today, every attendance range the views ask for today reads it
+        chunk_start, chunk_end = split_date_range(today, today, ATTENDANCE_CHUNK_DAYS)[0]
+        queries = []
+
+        # the same queries the miniapp supervision views send on a first open
+        for student_code in student_codes:
+            queries.append(time_tables_query(student_code, today))
+            queries.append(attendances_query(student_code, chunk_start, chunk_end))
+            queries.append(academic_classifications_query(student_code))
+
+        with BduDwCallRecorder(run_id).recording():
+            num_warmed = run_with_async_service(
+                lambda service: service.prewarm(queries),
+                use_cache=False,
+                concurrency=config("BDU_DW_PREWARM_CONCURRENCY", 10, cast=int),
+                priority=PRIORITY_BATCH
+            )
+
+        _end_time = datetime.datetime.now()
+        save_task_run("prewarm_bdu_dw_cache", run_id, _start_time, _end_time, num_students=len(student_codes), num_errors=len(queries) - num_warmed)
+
+        logging.getLogger().info("prewarm_bdu_dw_cache num_students=%s, num_warmed=%s, num_queries=%s, duration=%s", len(student_codes), num_warmed, len(queries), _end_time - _start_time)
+
+        return {
+            "task": "prewarm_bdu_dw_cache",
+            "start_time": _start_time,
+            "end_time": _end_time,
+            "duration": (_end_time - _start_time).total_seconds(),
+            "num_students": len(student_codes),
+            "num_warmed": num_warmed,
+            "num_failed": len(queries) - num_warmed
+        }
+    except Exception as e:
+        logging.getLogger().exception("prewarm_bdu_dw_cache exc=%s", str(e))
+        save_task_run("prewarm_bdu_dw_cache", run_id, _start_time, datetime.datetime.now(), failed=True, num_errors=1)
+        raise e
@@ -0,0 +1,32 @@
+import datetime
+from rest_framework import serializers
+
+from bduSuport.helpers.local_time import local_today
+from bduSuport.services.bdu_dw.cache import get_current_semester
+
+class StudentOverviewFilter(serializers.Serializer):
+    def __init__(self, instance=None, data=..., **kwargs):
+        self.__max_date_diff = kwargs.pop("max_date_diff", 31)
+        super().__init__(instance, data, **kwargs)
+
+    date = serializers.DateField(required=False)
+    from_date = serializers.DateField(required=False)
+    to_date = serializers.DateField(required=False)
+    start_year = serializers.IntegerField(required=False, min_value=2000)
+    semester = serializers.IntegerField(required=False, min_value=1, max_value=3)
+
+    def validate(self, attrs):
+        _attrs = super().validate(attrs)
+        today = local_today()
+        start_year, semester = get_current_semester(today)
+
+        _attrs.setdefault("date", today)
+        _attrs.setdefault("to_date", _attrs["date"])
+        _attrs.setdefault("from_date", _attrs["to_date"] - datetime.timedelta(days=6))
+        _attrs.setdefault("start_year", start_year)
+        _attrs.setdefault("semester", semester)
+
+        if _attrs["to_date"] < _attrs["from_date"] or (_attrs["to_date"] - _attrs["from_date"]).days > self.__max_date_diff:
+            raise serializers.ValidationError("invalid date range!")
+
+        return _attrs
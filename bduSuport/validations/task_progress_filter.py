@@ -0,0 +1,4 @@
+from rest_framework import serializers
+
+class TaskProgressFilter(serializers.Serializer):
+    task = serializers.CharField()
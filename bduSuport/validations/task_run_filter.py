@@ -0,0 +1,4 @@
+from rest_framework import serializers
+
+class TaskRunFilter(serializers.Serializer):
+    task = serializers.CharField(required=False)
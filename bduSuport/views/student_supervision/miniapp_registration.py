@@ -9,7 +9,8 @@ from bduSuport.helpers.response import RestResponse
 from bduSuport.middlewares.miniapp_authentication import MiniAppAuthentication
 from bduSuport.models.student_supervision_registration import StudentSupervisionRegistration
 from bduSuport.validations.submit_student_supervision_registration import SubmitStudentSupervisionRegistration
-from bduSuport.services.bdu_dw.bdu_dw import BduDwService
+from bduSuport.services.bdu_dw.student_mirror import BduStudentMirror
+from bduSuport.services.supervision_access import SupervisionAccessService
 from bduSuport.serializers.student_supervision_registration import StudentSupervisionRegistrationSerializer
 
 class MiniappStudentSupervisionRegistrationView(viewsets.ViewSet):
@@ -28,7 +29,7 @@ class MiniappStudentSupervisionRegistrationView(viewsets.ViewSet):
             citizen_id = validate.validated_data["citizen_id"]
             birthday = validate.validated_data["birthday"]
 
-            student = BduDwService().get_student(student_code)
+            student = BduStudentMirror().get_student(student_code)
 
             if student is None:
                 return RestResponse(data=None, status=status.HTTP_400_BAD_REQUEST, message="Mã số sinh viên không tồn tại!").response
@@ -48,6 +49,7 @@ class MiniappStudentSupervisionRegistrationView(viewsets.ViewSet):
                 student_full_name=student.full_name,
                 miniapp_user=request.user
             ).save()
+            SupervisionAccessService().invalidate(request.user)
 
             return RestResponse(status=status.HTTP_200_OK, message=f"Đăng ký nhận thông tin về  sinh viên {student.student_id} - {student.full_name} thành công!").response
         except Exception as e:
@@ -75,6 +77,7 @@ class MiniappStudentSupervisionRegistrationView(viewsets.ViewSet):
             registration = StudentSupervisionRegistration.objects.get(miniapp_user=request.user, deleted_at=None, id=pk)
             registration.deleted_at = datetime.datetime.now()
             registration.save()
+            SupervisionAccessService().invalidate(request.user)
 
             return RestResponse().response
         except StudentSupervisionRegistration.DoesNotExist:
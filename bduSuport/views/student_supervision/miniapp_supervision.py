@@ -1,5 +1,4 @@
 import logging
-from dataclasses import asdict
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from drf_yasg.utils import swagger_auto_schema
@@ -8,9 +7,18 @@ from drf_yasg import openapi
 from bduSuport.helpers.response import RestResponse
 from bduSuport.middlewares.miniapp_authentication import MiniAppAuthentication
 from bduSuport.models.student_supervision_registration import StudentSupervisionRegistration
+from bduSuport.services.bdu_dw.async_bdu_dw import AsyncBduDwService, run_with_async_service
 from bduSuport.services.bdu_dw.bdu_dw import BduDwService
+from bduSuport.services.bdu_dw.dto import dto_to_dict
+from bduSuport.services.supervision_access import SupervisionAccessService
 from bduSuport.validations.date_filter import DateFilter
 from bduSuport.validations.date_range_filter import DateRangeFilter
+from bduSuport.validations.student_overview_filter import StudentOverviewFilter
+
+# attendances are fetched in cached chunks, a whole semester is as cheap as a month
+ATTENDANCE_MAX_DATE_DIFF = 200
+OVERVIEW_MAX_DATE_DIFF = 31
+TIME_TABLES_MAX_DATE_DIFF = 31
 
 class MiniappStudentSupervisionView(viewsets.ViewSet):
     authentication_classes = (MiniAppAuthentication, )
@@ -24,23 +32,30 @@ class MiniappStudentSupervisionView(viewsets.ViewSet):
         try:
             logging.getLogger().info("MiniappStudentSupervisionView.get_attendances pk=%s, params=%s", pk, request.query_params)
 
-            validate = DateRangeFilter(data=request.query_params)
+            validate = DateRangeFilter(data=request.query_params, max_date_diff=ATTENDANCE_MAX_DATE_DIFF)
 
             if not validate.is_valid():
-                return RestResponse(data=validate.errors, status=status.HTTP_400_BAD_REQUEST, message="Bạn chỉ có thể xem dữ liệu trong 30 ngày liên tiếp!").response
+                return RestResponse(data=validate.errors, status=status.HTTP_400_BAD_REQUEST, message=f"Bạn chỉ có thể xem dữ liệu trong {ATTENDANCE_MAX_DATE_DIFF} ngày liên tiếp!").response
 
-            if not StudentSupervisionRegistration.objects.filter(deleted_at=None, miniapp_user=request.user, student_dw_code=pk).exists():
+            if not SupervisionAccessService().can_access(request.user, pk):
                 return RestResponse(status=status.HTTP_400_BAD_REQUEST, message="Bạn không có quyền xem dữ liệu sinh viên này!").response
             
-            attendances = BduDwService().get_attendances_by_student_code_and_date_range(
+            service = BduDwService()
+            attendances = service.get_attendances_by_date_range(
                 student_code=pk,
                 date_start=validate.validated_data["from_date"],
                 date_end=validate.validated_data["to_date"]
             )
-            result = [asdict(attendance) for attendance in attendances]
+            result = [dto_to_dict(attendance) for attendance in attendances]
             sorted_result = sorted(result, key=lambda x: x["attendance_date"], reverse=True)
 
-            return RestResponse(sorted_result).response
+            # a chunk of the range could not be fetched, the days it covers are missing from the result
+            if service.served_partial:
+                code = "partial_data"
+            else:
+                code = "stale_data" if service.served_stale else ""
+
+            return RestResponse(sorted_result, code=code).response
         except Exception as e:
             logging.getLogger().exception("MiniappStudentSupervisionView.get_attendances exc=%s, pk=%s, params=%s", e, pk, request.query_params)
             return RestResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR).response
@@ -54,17 +69,18 @@ class MiniappStudentSupervisionView(viewsets.ViewSet):
         try:
             logging.getLogger().info("MiniappStudentSupervisionView.get_scores pk=%s, params=%s", pk, request.query_params)
 
-            if not StudentSupervisionRegistration.objects.filter(deleted_at=None, miniapp_user=request.user, student_dw_code=pk).exists():
+            if not SupervisionAccessService().can_access(request.user, pk):
                 return RestResponse(status=status.HTTP_400_BAD_REQUEST, message="Bạn không có quyền xem dữ liệu sinh viên này!").response
             
-            scores = BduDwService().get_student_scores(
+            service = BduDwService()
+            scores = service.get_student_scores(
                 student_code=pk,
                 semester=request.query_params.get("semester", 1),
                 academic_year=int(request.query_params.get("academic_year", 0))
             )
-            result = [asdict(score) for score in scores]
+            result = [dto_to_dict(score) for score in scores]
 
-            return RestResponse(result).response
+            return RestResponse(result, code="stale_data" if service.served_stale else "").response
         except Exception as e:
             logging.getLogger().exception("MiniappStudentSupervisionView.get_scores exc=%s, pk=%s, params=%s", e, pk, request.query_params)
             return RestResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR).response
@@ -82,21 +98,58 @@ class MiniappStudentSupervisionView(viewsets.ViewSet):
             if not validate.is_valid():
                 return RestResponse(data=validate.errors, status=status.HTTP_400_BAD_REQUEST, message="Bạn chỉ có thể xem dữ liệu trong 30 ngày liên tiếp!").response
 
-            if not StudentSupervisionRegistration.objects.filter(deleted_at=None, miniapp_user=request.user, student_dw_code=pk).exists():
+            if not SupervisionAccessService().can_access(request.user, pk):
                 return RestResponse(status=status.HTTP_400_BAD_REQUEST, message="Bạn không có quyền xem dữ liệu sinh viên này!").response
             
-            time_tables = BduDwService().get_time_tables(
+            service = BduDwService()
+            time_tables = service.get_time_tables(
                 student_code=pk,
                 date=validate.validated_data["date"],
             )
-            result = [asdict(time_table) for time_table in time_tables]
+            result = [dto_to_dict(time_table) for time_table in time_tables]
             sorted_result = sorted(result, key=lambda x: x["start_period"], reverse=False)
 
-            return RestResponse(sorted_result).response
+            return RestResponse(sorted_result, code="stale_data" if service.served_stale else "").response
         except Exception as e:
             logging.getLogger().exception("MiniappStudentSupervisionView.get_time_tables exc=%s, pk=%s, params=%s", e, pk, request.query_params)
             return RestResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR).response
 
+    @action(methods=["GET"], detail=True, url_path="time-tables/range")
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter("from_date", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("to_date", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING),
+    ])
+    def get_time_tables_range(self, request, pk):
+        try:
+            logging.getLogger().info("MiniappStudentSupervisionView.get_time_tables_range pk=%s, params=%s", pk, request.query_params)
+
+            validate = DateRangeFilter(data=request.query_params, max_date_diff=TIME_TABLES_MAX_DATE_DIFF)
+
+            if not validate.is_valid():
+                return RestResponse(data=validate.errors, status=status.HTTP_400_BAD_REQUEST, message=f"Bạn chỉ có thể xem dữ liệu trong {TIME_TABLES_MAX_DATE_DIFF} ngày liên tiếp!").response
+
+            if not SupervisionAccessService().can_access(request.user, pk):
+                return RestResponse(status=status.HTTP_400_BAD_REQUEST, message="Bạn không có quyền xem dữ liệu sinh viên này!").response
+
+            service = BduDwService()
+            time_tables = service.get_time_tables_by_date_range(
+                student_code=pk,
+                date_start=validate.validated_data["from_date"],
+                date_end=validate.validated_data["to_date"]
+            )
+            result = [
+                {
+                    "date": _date,
+                    "time_tables": sorted([dto_to_dict(time_table) for time_table in day_time_tables], key=lambda x: x["start_period"]),
+                }
+                for _date, day_time_tables in sorted(time_tables.items())
+            ]
+
+            return RestResponse(result, code="stale_data" if service.served_stale else "").response
+        except Exception as e:
+            logging.getLogger().exception("MiniappStudentSupervisionView.get_time_tables_range exc=%s, pk=%s, params=%s", e, pk, request.query_params)
+            return RestResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR).response
+
     @action(methods=["GET"], detail=True, url_path="events")
     @swagger_auto_schema(manual_parameters=[
         openapi.Parameter("start_year", in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=True),
@@ -118,15 +171,16 @@ class MiniappStudentSupervisionView(viewsets.ViewSet):
 
             nkhk = int(f"{start_year % 100}{(start_year + 1) % 100}{semester}")
 
-            if not StudentSupervisionRegistration.objects.filter(deleted_at=None, miniapp_user=request.user, student_dw_code=pk).exists():
+            if not SupervisionAccessService().can_access(request.user, pk):
                 return RestResponse(status=status.HTTP_400_BAD_REQUEST, message="Bạn không có quyền xem dữ liệu sinh viên này!").response
 
-            events = BduDwService().get_student_events(
+            service = BduDwService()
+            events = service.get_student_events(
                 student_code=pk,
                 nkhk=nkhk
             )
-            result = [asdict(event) for event in events]
-            return RestResponse(result).response
+            result = [dto_to_dict(event) for event in events]
+            return RestResponse(result, code="stale_data" if service.served_stale else "").response
         except Exception as e:
             logging.getLogger().exception("MiniappStudentSupervisionView.get_events exc=%s, pk=%s, params=%s", e, pk, request.query_params)
             return RestResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR).response
@@ -136,20 +190,156 @@ class MiniappStudentSupervisionView(viewsets.ViewSet):
         try:
             logging.getLogger().info("MiniappStudentSupervisionView.get_academic_classifications pk=%s", pk)
 
-            if not StudentSupervisionRegistration.objects.filter(deleted_at=None, miniapp_user=request.user, student_dw_code=pk).exists():
+            if not SupervisionAccessService().can_access(request.user, pk):
                 return RestResponse(status=status.HTTP_400_BAD_REQUEST, message="Bạn không có quyền xem dữ liệu sinh viên này!").response
 
-            classifications = BduDwService().get_student_academic_classifications(
+            service = BduDwService()
+            classifications = service.get_student_academic_classifications(
                 student_code=pk
             )
             
             result = []
             for classification in classifications:
-                result.append(asdict(classification))
+                result.append(dto_to_dict(classification))
 
             result = sorted(result, key=lambda x: x["semester_code"], reverse=True)
 
-            return RestResponse(result).response
+            return RestResponse(result, code="stale_data" if service.served_stale else "").response
         except Exception as e:
             logging.getLogger().exception("MiniappStudentSupervisionView.get_academic_classifications exc=%s, pk=%s", e, pk)
+            return RestResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR).response
+
+    @action(methods=["GET"], detail=True, url_path="overview")
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter("date", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("from_date", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("to_date", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("start_year", in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        openapi.Parameter("semester", in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ])
+    def get_overview(self, request, pk):
+        """
+        Attendances, scores, time tables, events and academic classifications of a student in one call,
+        the five datasets are fetched concurrently and one failing only marks its own entry with an error.
+        """
+        try:
+            logging.getLogger().info("MiniappStudentSupervisionView.get_overview pk=%s, params=%s", pk, request.query_params)
+
+            validate = StudentOverviewFilter(data=request.query_params, max_date_diff=OVERVIEW_MAX_DATE_DIFF)
+
+            if not validate.is_valid():
+                return RestResponse(data=validate.errors, status=status.HTTP_400_BAD_REQUEST, message=f"Bạn chỉ có thể xem dữ liệu trong {OVERVIEW_MAX_DATE_DIFF} ngày liên tiếp!").response
+
+            if not SupervisionAccessService().can_access(request.user, pk):
+                return RestResponse(status=status.HTTP_400_BAD_REQUEST, message="Bạn không có quyền xem dữ liệu sinh viên này!").response
+
+            params = validate.validated_data
+            start_year = params["start_year"]
+            nkhk = int(f"{start_year % 100}{(start_year + 1) % 100}{params['semester']}")
+
+            async def fetch_overview(service: AsyncBduDwService):
+                results = await service.gather([
+                    service.get_attendances_by_date_range(pk, params["from_date"], params["to_date"]),
+                    service.get_student_scores(pk, params["semester"], start_year),
+                    service.get_time_tables(pk, params["date"]),
+                    service.get_student_events(pk, nkhk),
+                    service.get_student_academic_classifications(pk),
+                ], return_exceptions=True)
+
+                return results, service.served_stale
+
+            results, served_stale = run_with_async_service(fetch_overview, strict=True)
+            sort_keys = [
+                ("attendances", "attendance_date", True),
+                ("scores", None, False),
+                ("time_tables", "start_period", False),
+                ("events", None, False),
+                ("academic_classifications", "semester_code", True),
+            ]
+            overview = {}
+
+            for (name, sort_key, reverse), result in zip(sort_keys, results):
+                if isinstance(result, Exception):
+                    logging.getLogger().error("MiniappStudentSupervisionView.get_overview dataset failed name=%s, exc=%s, pk=%s", name, result, pk)
+                    overview[name] = {"data": None, "error": "unavailable"}
+                    continue
+
+                data = [dto_to_dict(item) for item in result]
+
+                if sort_key is not None:
+                    data = sorted(data, key=lambda x: x[sort_key], reverse=reverse)
+
+                overview[name] = {"data": data, "error": None}
+
+            if any(dataset["error"] for dataset in overview.values()):
+                code = "partial_data"
+            else:
+                code = "stale_data" if served_stale else ""
+
+            return RestResponse(overview, code=code).response
+        except Exception as e:
+            logging.getLogger().exception("MiniappStudentSupervisionView.get_overview exc=%s, pk=%s, params=%s", e, pk, request.query_params)
+            return RestResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR).response
+
+    @action(methods=["GET"], detail=False, url_path="overview", url_name="students_overview")
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter("date", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING),
+    ])
+    def get_students_overview(self, request):
+        """
+        Time tables and attendances on a day of every student supervised by the user, fetched concurrently.
+        """
+        try:
+            logging.getLogger().info("MiniappStudentSupervisionView.get_students_overview params=%s", request.query_params)
+
+            validate = StudentOverviewFilter(data=request.query_params)
+
+            if not validate.is_valid():
+                return RestResponse(data=validate.errors, status=status.HTTP_400_BAD_REQUEST).response
+
+            date = validate.validated_data["date"]
+            registrations = StudentSupervisionRegistration.objects.filter(deleted_at=None, miniapp_user=request.user).order_by("id")
+            student_names = {}
+
+            for registration in registrations:
+                student_names.setdefault(registration.student_dw_code, registration.student_full_name)
+
+            student_codes = list(student_names.keys())
+
+            async def fetch_overview(service: AsyncBduDwService):
+                results = await service.gather(
+                    [service.get_time_tables(code, date) for code in student_codes]
+                    + [service.get_attendances_by_date_range(code, date, date) for code in student_codes],
+                    return_exceptions=True
+                )
+
+                return results, service.served_stale
+
+            results, served_stale = run_with_async_service(fetch_overview, strict=True) if student_codes else ([], False)
+            time_tables, attendances = results[:len(student_codes)], results[len(student_codes):]
+            overview = []
+            has_error = False
+
+            for student_code, student_time_tables, student_attendances in zip(student_codes, time_tables, attendances):
+                student_overview = {"student_dw_code": student_code, "student_full_name": student_names[student_code]}
+
+                for name, result, sort_key in [("time_tables", student_time_tables, "start_period"), ("attendances", student_attendances, "attendance_date")]:
+                    if isinstance(result, Exception):
+                        logging.getLogger().error("MiniappStudentSupervisionView.get_students_overview dataset failed name=%s, exc=%s, student_code=%s", name, result, student_code)
+                        student_overview[name] = {"data": None, "error": "unavailable"}
+                        has_error = True
+                        continue
+
+                    student_overview[name] = {"data": sorted([dto_to_dict(item) for item in result], key=lambda x: x[sort_key]), "error": None}
+
+                overview.append(student_overview)
+
+            if has_error:
+                code = "partial_data"
+            else:
+                code = "stale_data" if served_stale else ""
+
+            return RestResponse(overview, code=code).response
+        except Exception as e:
+            logging.getLogger().exception("MiniappStudentSupervisionView.get_students_overview exc=%s, params=%s", e, request.query_params)
             return RestResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR).response
\ No newline at end of file
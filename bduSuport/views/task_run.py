@@ -0,0 +1,70 @@
+import logging
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+
+from bduSuport.helpers.paginator import CustomPageNumberPagination
+from bduSuport.helpers.response import RestResponse
+from bduSuport.middlewares.backoffice_authentication import BackofficeAuthentication
+from bduSuport.middlewares.permissions.is_root import IsRoot
+from bduSuport.models.task_run import TaskRun
+from bduSuport.serializers.task_run import TaskRunSerializer
+from bduSuport.services.notification_checkpoint import get_latest_progress
+from bduSuport.validations.task_progress_filter import TaskProgressFilter
+from bduSuport.validations.task_run_filter import TaskRunFilter
+
+class TaskRunView(viewsets.ViewSet):
+    authentication_classes = (BackofficeAuthentication, )
+    permission_classes = (IsRoot, )
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter("task", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter("page", in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        openapi.Parameter("size", in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ])
+    def list(self, request):
+        try:
+            validate = TaskRunFilter(data=request.query_params)
+
+            if not validate.is_valid():
+                return RestResponse(status=status.HTTP_400_BAD_REQUEST, message="Vui lòng kiểm tra lại dữ liệu của bạn!").response
+
+            queryset = TaskRun.objects.all().order_by("-started_at")
+
+            if "task" in validate.validated_data:
+                queryset = queryset.filter(task=validate.validated_data["task"])
+
+            paginator = CustomPageNumberPagination()
+            queryset = paginator.paginate_queryset(queryset, request)
+            data = TaskRunSerializer(queryset, many=True).data
+
+            return RestResponse(data=paginator.get_paginated_data(data), status=status.HTTP_200_OK).response
+        except Exception as e:
+            logging.getLogger().exception("TaskRunView.list exc=%s, params=%s", e, request.query_params)
+            return RestResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR).response
+
+    @action(methods=["GET"], detail=False, url_path="progress")
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter("task", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True),
+    ])
+    def get_progress(self, request):
+        """
+        Progress of the latest run of a checkpointed notification task (e.g. send_student_attendance_notification),
+        while it runs or for a day after: status, chunks done out of num_chunks and the student counters.
+        """
+        try:
+            validate = TaskProgressFilter(data=request.query_params)
+
+            if not validate.is_valid():
+                return RestResponse(data=validate.errors, status=status.HTTP_400_BAD_REQUEST, message="Vui lòng kiểm tra lại dữ liệu của bạn!").response
+
+            progress = get_latest_progress(validate.validated_data["task"])
+
+            if progress is None:
+                return RestResponse(status=status.HTTP_404_NOT_FOUND).response
+
+            return RestResponse(data=progress, status=status.HTTP_200_OK).response
+        except Exception as e:
+            logging.getLogger().exception("TaskRunView.get_progress exc=%s, params=%s", e, request.query_params)
+            return RestResponse(status=status.HTTP_500_INTERNAL_SERVER_ERROR).response